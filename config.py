@@ -1,48 +1,92 @@
 import os
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 
 from dotenv import load_dotenv
 
-load_dotenv()
-
 BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / "data"
 DATABASE_PATH = DATA_DIR / "quotes.db"
 
-# Telegram settings
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
-# Weekly digest settings
-DIGEST_ENABLED = os.getenv("DIGEST_ENABLED", "true").lower() == "true"
-DIGEST_DAY = os.getenv("DIGEST_DAY", "sunday").lower()
-DIGEST_TIME = os.getenv("DIGEST_TIME", "10:00")
-DIGEST_COUNT = int(os.getenv("DIGEST_COUNT", "10"))
+# Day names in cron order (monday == 0)
+DAY_MAP = (
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+)
+
+
+def _parse_time(value: str) -> tuple[int, int]:
+    hour, minute = value.split(":")
+    return int(hour), int(minute)
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Environment-driven settings, read once per process."""
+
+    # Telegram settings
+    telegram_bot_token: str | None
+
+    # Weekly digest settings
+    digest_enabled: bool
+    digest_day_idx: int
+    digest_hour: int
+    digest_minute: int
+    digest_count: int
+
+    # Daily quote of the day settings
+    daily_quote_enabled: bool
+    daily_quote_hour: int
+    daily_quote_minute: int
+
+    @classmethod
+    def load(cls) -> "Settings":
+        """Read settings from the environment (and .env)."""
+        load_dotenv()
+        digest_day = os.getenv("DIGEST_DAY", "sunday").lower()
+        digest_hour, digest_minute = _parse_time(os.getenv("DIGEST_TIME", "10:00"))
+        daily_hour, daily_minute = _parse_time(os.getenv("DAILY_QUOTE_TIME", "09:00"))
+        return cls(
+            telegram_bot_token=os.getenv("TELEGRAM_BOT_TOKEN"),
+            digest_enabled=os.getenv("DIGEST_ENABLED", "true").lower() == "true",
+            digest_day_idx=DAY_MAP.index(digest_day) if digest_day in DAY_MAP else 6,
+            digest_hour=digest_hour,
+            digest_minute=digest_minute,
+            digest_count=int(os.getenv("DIGEST_COUNT", "10")),
+            daily_quote_enabled=os.getenv("DAILY_QUOTE_ENABLED", "true").lower() == "true",
+            daily_quote_hour=daily_hour,
+            daily_quote_minute=daily_minute,
+        )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load settings on first use."""
+    return Settings.load()
 
-# Daily quote of the day settings
-DAILY_QUOTE_ENABLED = os.getenv("DAILY_QUOTE_ENABLED", "true").lower() == "true"
-DAILY_QUOTE_TIME = os.getenv("DAILY_QUOTE_TIME", "09:00")
 
 # Validate required settings
 def validate_config():
-    if not TELEGRAM_BOT_TOKEN:
+    if not get_settings().telegram_bot_token:
         raise ValueError("TELEGRAM_BOT_TOKEN is required. Set it in .env file.")
 
-# Day name to cron day mapping
-DAY_MAP = {
-    "monday": 0,
-    "tuesday": 1,
-    "wednesday": 2,
-    "thursday": 3,
-    "friday": 4,
-    "saturday": 5,
-    "sunday": 6,
-}
 
 def get_digest_schedule():
-    day = DAY_MAP.get(DIGEST_DAY, 6)
-    hour, minute = DIGEST_TIME.split(":")
-    return {"day_of_week": day, "hour": int(hour), "minute": int(minute)}
+    settings = get_settings()
+    return {
+        "day_of_week": settings.digest_day_idx,
+        "hour": settings.digest_hour,
+        "minute": settings.digest_minute,
+    }
+
 
 def get_daily_quote_schedule():
-    hour, minute = DAILY_QUOTE_TIME.split(":")
-    return {"hour": int(hour), "minute": int(minute)}
+    settings = get_settings()
+    return {"hour": settings.daily_quote_hour, "minute": settings.daily_quote_minute}
@@ -1,9 +1,11 @@
 import asyncio
 import logging
+import signal
 
 from config import validate_config
-from src.bot import create_bot
-from src.database import init_db
+from src.bot import ALLOWED_UPDATES, create_bot
+from src.database import close_db, init_db
+from src.metadata import close_client
 from src.scheduler import setup_scheduler
 
 logging.basicConfig(
@@ -34,17 +36,25 @@ async def main():
         # Start polling
         logger.info("Starting bot...")
         await app.start()
-        await app.updater.start_polling(drop_pending_updates=True)
+        await app.updater.start_polling(
+            drop_pending_updates=True,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+
+        # Run until SIGINT/SIGTERM without waking the event loop while idle
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
 
-        # Run until interrupted
         try:
-            while True:
-                await asyncio.sleep(1)
-        except asyncio.CancelledError:
-            pass
+            await stop_event.wait()
+            logger.info("Shutdown signal received")
         finally:
             await app.updater.stop()
             await app.stop()
+            await close_client()
+            await close_db()
 
 
 if __name__ == "__main__":
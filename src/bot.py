@@ -1,18 +1,26 @@
+import asyncio
+import logging
+import sys
 from datetime import datetime, timedelta
+from weakref import WeakValueDictionary
 
 from telegram import Update
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     ContextTypes,
     MessageHandler,
     filters,
 )
+from telegram.request import HTTPXRequest
 
-from config import TELEGRAM_BOT_TOKEN
+from config import get_settings
 from src.database import (
+    DatabaseError,
     delete_quote,
     export_all_quotes,
+    get_favorite_count,
     get_favorite_quotes,
     get_last_quotes,
     get_quote_by_id,
@@ -21,19 +29,112 @@ from src.database import (
     get_quotes_by_tag,
     get_quotes_this_week,
     get_random_quotes,
+    get_stored_metadata,
     get_top_tags,
-    is_duplicate,
     register_user,
     save_quote,
     search_quotes,
+    store_metadata,
     toggle_favorite,
 )
-from src.metadata import fetch_metadata
+from src.formatting import format_quote, format_quote_list, truncate
+from src.metadata import (
+    METADATA_CACHE_TTL,
+    ArticleMetadata,
+    cache_metadata,
+    download_metadata,
+    get_cached_metadata,
+    normalize_url,
+)
 from src.parser import parse_message
+from src.scheduler import send_digest_to_user
+
+logger = logging.getLogger(__name__)
 
 # How long to remember a pending URL (in minutes)
 PENDING_URL_TIMEOUT = 5
 
+# Identical quotes saved within this many minutes are treated as duplicates
+DUPLICATE_WINDOW = 1
+
+# Max updates handled at once, so a slow metadata fetch doesn't block other chats
+# (updates from the same chat still run in order, see ChatOrderedUpdateProcessor)
+MAX_CONCURRENT_UPDATES = 32
+
+# Outgoing API calls share one HTTP/2 pool sized for the concurrent handlers
+BOT_API_POOL_SIZE = 64
+BOT_API_POOL_TIMEOUT = 5.0
+
+# Only messages (text and commands) have handlers, so don't poll for anything else
+ALLOWED_UPDATES = [Update.MESSAGE]
+
+# Shown by /start and /help
+_WELCOME_TEXT = (
+    "Welcome to Flashback Bot!\n\n"
+    "How to save a quote:\n"
+    "1. Share a URL to me first\n"
+    "2. Then send the quote text\n"
+    "(Or send both together)\n\n"
+    "Add #tags to categorize.\n\n"
+    "Commands:\n"
+    "/random - Get a random quote\n"
+    "/last - Show recently saved quotes\n"
+    "/digest - Get your digest now\n"
+    "/stats - View your statistics\n"
+    "/cancel - Clear pending URL\n\n"
+    "Search:\n"
+    "/search <word> - Search in quotes\n"
+    "/tag <name> - Find by tag\n"
+    "/source <domain> - Find by source\n\n"
+    "Manage:\n"
+    "/fav <id> - Toggle favorite\n"
+    "/favorites - Show all favorites\n"
+    "/delete <id> - Delete a quote\n"
+    "/export - Export all quotes as JSON"
+)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates from different chats concurrently, but one at a time per chat.
+
+    "Send a URL, then the quote" depends on the URL being handled first,
+    and its metadata fetch can take seconds.
+    """
+
+    __slots__ = ("_chat_locks", "_handler_slots")
+
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # The base class takes its slot before do_process_update, so an update
+        # waiting on its chat's lock would hold one and a burst from one chat
+        # could stall every other chat. Leave it unbounded and take
+        # _handler_slots only once the chat's turn has come.
+        super().__init__(sys.maxsize)
+        self._handler_slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # Locks disappear once no update for the chat holds or awaits them
+        self._chat_locks: WeakValueDictionary[int, asyncio.Lock] = WeakValueDictionary()
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._handler_slots:
+                await coroutine
+            return
+
+        lock = self._chat_locks.get(chat.id)
+        if lock is None:
+            lock = self._chat_locks[chat.id] = asyncio.Lock()
+        async with lock, self._handler_slots:
+            await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
 
 def get_user_id(update: Update) -> int:
     """Get the user's chat ID."""
@@ -55,29 +156,7 @@ async def ensure_registered(update: Update) -> int:
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await ensure_registered(update)
 
-    await update.message.reply_text(
-        "Welcome to Flashback Bot!\n\n"
-        "How to save a quote:\n"
-        "1. Share a URL to me first\n"
-        "2. Then send the quote text\n"
-        "(Or send both together)\n\n"
-        "Add #tags to categorize.\n\n"
-        "Commands:\n"
-        "/random - Get a random quote\n"
-        "/last - Show recently saved quotes\n"
-        "/digest - Get your digest now\n"
-        "/stats - View your statistics\n"
-        "/cancel - Clear pending URL\n\n"
-        "Search:\n"
-        "/search <word> - Search in quotes\n"
-        "/tag <name> - Find by tag\n"
-        "/source <domain> - Find by source\n\n"
-        "Manage:\n"
-        "/fav <id> - Toggle favorite\n"
-        "/favorites - Show all favorites\n"
-        "/delete <id> - Delete a quote\n"
-        "/export - Export all quotes as JSON"
-    )
+    await update.message.reply_text(_WELCOME_TEXT)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -89,7 +168,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     total = await get_quote_count(user_id)
     this_week = await get_quotes_this_week(user_id)
-    favorites = len(await get_favorite_quotes(user_id))
+    favorites = await get_favorite_count(user_id)
     top_tags = await get_top_tags(user_id, 5)
 
     tags_text = ""
@@ -134,11 +213,8 @@ async def last_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("No quotes saved yet.")
         return
 
-    response = f"Last {len(quotes)} quote(s):\n\n"
-    for quote in quotes:
-        response += f"{format_quote(quote, show_id=True)}\n\n"
-
-    await update.message.reply_text(response[:4000])
+    header = f"Last {len(quotes)} quote(s):\n\n"
+    await update.message.reply_text(format_quote_list(header, quotes))
 
 
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -155,11 +231,8 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f'No quotes found containing "{keyword}"')
         return
 
-    response = f'Found {len(quotes)} quote(s) for "{keyword}":\n\n'
-    for quote in quotes[:5]:
-        response += f"{format_quote(quote, show_id=True)}\n\n"
-
-    await update.message.reply_text(response[:4000])
+    header = f'Found {len(quotes)} quote(s) for "{keyword}":\n\n'
+    await update.message.reply_text(format_quote_list(header, quotes[:5]))
 
 
 async def tag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -176,11 +249,8 @@ async def tag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f'No quotes found with tag #{tag}')
         return
 
-    response = f'Found {len(quotes)} quote(s) with #{tag}:\n\n'
-    for quote in quotes[:5]:
-        response += f"{format_quote(quote, show_id=True)}\n\n"
-
-    await update.message.reply_text(response[:4000])
+    header = f'Found {len(quotes)} quote(s) with #{tag}:\n\n'
+    await update.message.reply_text(format_quote_list(header, quotes[:5]))
 
 
 async def source_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -197,11 +267,8 @@ async def source_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f'No quotes found from {domain}')
         return
 
-    response = f'Found {len(quotes)} quote(s) from {domain}:\n\n'
-    for quote in quotes[:5]:
-        response += f"{format_quote(quote, show_id=True)}\n\n"
-
-    await update.message.reply_text(response[:4000])
+    header = f'Found {len(quotes)} quote(s) from {domain}:\n\n'
+    await update.message.reply_text(format_quote_list(header, quotes[:5]))
 
 
 async def fav_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -229,19 +296,15 @@ async def fav_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def favorites_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = await ensure_registered(update)
 
-    quotes = await get_favorite_quotes(user_id)
-    if not quotes:
+    total = await get_favorite_count(user_id)
+    if not total:
         await update.message.reply_text("No favorite quotes yet. Use /fav <id> to add some!")
         return
 
-    response = f"Your {len(quotes)} favorite quote(s):\n\n"
-    for quote in quotes[:10]:
-        response += f"{format_quote(quote, show_id=True)}\n\n"
-
-    if len(quotes) > 10:
-        response += f"... and {len(quotes) - 10} more"
-
-    await update.message.reply_text(response[:4000])
+    quotes = await get_favorite_quotes(user_id, limit=10)
+    header = f"Your {total} favorite quote(s):\n\n"
+    footer = f"... and {total - len(quotes)} more" if total > len(quotes) else ""
+    await update.message.reply_text(format_quote_list(header, quotes, footer))
 
 
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -274,16 +337,13 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = await ensure_registered(update)
 
-    json_data = await export_all_quotes(user_id)
     count = await get_quote_count(user_id)
-
     if count == 0:
         await update.message.reply_text("No quotes to export.")
         return
 
     # Send as a document
-    from io import BytesIO
-    file = BytesIO(json_data.encode())
+    file = await export_all_quotes(user_id)
     file.name = "readwiser_quotes.json"
 
     await update.message.reply_document(
@@ -295,10 +355,39 @@ async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = await ensure_registered(update)
 
-    from src.scheduler import send_digest_to_user
     await send_digest_to_user(context.bot, user_id)
 
 
+async def get_metadata(url: str) -> ArticleMetadata:
+    """Get metadata for a URL from memory, then the database, then the network."""
+    cached = get_cached_metadata(url)
+    if cached is not None:
+        return cached
+
+    # The database is only a cache: if it fails, fall through to the network
+    # rather than losing the user's quote
+    key = normalize_url(url)
+    try:
+        stored = await get_stored_metadata(key, timedelta(seconds=METADATA_CACHE_TTL))
+    except DatabaseError as e:
+        logger.warning(f"Could not read stored metadata for {url}: {e}")
+        stored = None
+    if stored is not None:
+        metadata = ArticleMetadata(**stored)
+        cache_metadata(url, metadata)
+        return metadata
+
+    metadata, fetched = await download_metadata(url)
+    # Only successful fetches are worth remembering
+    if fetched:
+        cache_metadata(url, metadata)
+        try:
+            await store_metadata(key, metadata.title, metadata.author, metadata.domain)
+        except DatabaseError as e:
+            logger.warning(f"Could not store metadata for {url}: {e}")
+    return metadata
+
+
 def get_pending_url(context: ContextTypes.DEFAULT_TYPE) -> tuple[str, dict] | None:
     """Get pending URL if it exists and hasn't expired."""
     pending = context.user_data.get("pending_url")
@@ -352,7 +441,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if is_url_only:
         # Store URL and ask for quote
-        metadata = await fetch_metadata(parsed.url)
+        metadata = await get_metadata(parsed.url)
         set_pending_url(context, parsed.url, {
             "title": metadata.title,
             "author": metadata.author,
@@ -381,31 +470,23 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Check for duplicates
-    if await is_duplicate(user_id, parsed.quote):
-        await update.message.reply_text("This quote was already saved recently.")
-        return
-
-    # Check for pending URL if no URL in current message
     url = parsed.url
     title, author, domain = None, None, None
 
     if url:
         # URL provided in this message - fetch fresh metadata
-        metadata = await fetch_metadata(url)
+        metadata = await get_metadata(url)
         title = metadata.title
         author = metadata.author
         domain = metadata.domain
-        clear_pending_url(context)  # Clear any pending URL
     else:
-        # Check for pending URL
+        # No URL in this message; use the pending one, if any
         pending = get_pending_url(context)
         if pending:
             url, metadata = pending
             title = metadata.get("title")
             author = metadata.get("author")
             domain = metadata.get("domain")
-            clear_pending_url(context)
 
     # Save to database
     quote_id = await save_quote(
@@ -416,7 +497,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         author=author,
         domain=domain,
         tags=parsed.tags,
+        dedupe_minutes=DUPLICATE_WINDOW,
     )
+    if quote_id is None:
+        await update.message.reply_text("This quote was already saved recently.")
+        return  # Keep any pending URL for the next new quote
+
+    clear_pending_url(context)  # Saved, so any pending URL is used up
 
     # Build confirmation message
     response = f'Saved (#{quote_id}): "{truncate(parsed.quote, 100)}"'
@@ -435,82 +522,25 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(response)
 
 
-def format_relative_time(timestamp_str: str) -> str:
-    """Format a timestamp as relative time (e.g., '2 days ago')."""
-    try:
-        # Parse the timestamp
-        timestamp = datetime.fromisoformat(timestamp_str)
-        now = datetime.now()
-        delta = now - timestamp
-
-        # Format based on time difference
-        if delta.days == 0:
-            hours = int(delta.seconds / 3600)
-            if hours == 0:
-                minutes = int(delta.seconds / 60)
-                if minutes == 0:
-                    return "just now"
-                return f"{minutes}m ago"
-            return f"{hours}h ago"
-        elif delta.days == 1:
-            return "yesterday"
-        elif delta.days < 7:
-            return f"{delta.days}d ago"
-        elif delta.days < 30:
-            weeks = int(delta.days / 7)
-            return f"{weeks}w ago"
-        elif delta.days < 365:
-            months = int(delta.days / 30)
-            return f"{months}mo ago"
-        else:
-            years = int(delta.days / 365)
-            return f"{years}y ago"
-    except (ValueError, TypeError):
-        return ""
-
-
-def format_quote(quote: dict, show_id: bool = False) -> str:
-    """Format a quote for display."""
-    prefix = f"[#{quote['id']}] " if show_id else ""
-    fav = " ⭐" if quote.get("is_favorite") else ""
-    text = f'{prefix}"{quote["text"]}"{fav}'
-
-    source_parts = []
-    if quote.get("source_title"):
-        source_parts.append(quote["source_title"])
-    if quote.get("source_author"):
-        source_parts.append(f"by {quote['source_author']}")
-    elif quote.get("source_domain"):
-        source_parts.append(f"({quote['source_domain']})")
-
-    if source_parts:
-        text += f"\n  -- {' '.join(source_parts)}"
-
-    if quote.get("url"):
-        text += f"\n  {quote['url']}"
-
-    if quote.get("tags"):
-        text += f"\n  {' '.join(f'#{t}' for t in quote['tags'].split(','))}"
-
-    # Add timestamp
-    if quote.get("created_at"):
-        relative_time = format_relative_time(quote["created_at"])
-        if relative_time:
-            text += f"\n  📅 Saved {relative_time}"
-
-    return text
-
-
-def truncate(text: str, length: int) -> str:
-    """Truncate text to length with ellipsis."""
-    if len(text) <= length:
-        return text
-    return text[:length - 3] + "..."
-
-
 def create_bot() -> Application:
     """Create and configure the Telegram bot."""
-    app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    # getUpdates long-polls, so it gets its own client and never holds
+    # a connection that sendMessage calls are waiting for
+    request = HTTPXRequest(
+        connection_pool_size=BOT_API_POOL_SIZE,
+        pool_timeout=BOT_API_POOL_TIMEOUT,
+        http_version="2",
+    )
+    get_updates_request = HTTPXRequest(http_version="2")
+
+    app = (
+        Application.builder()
+        .token(get_settings().telegram_bot_token)
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .request(request)
+        .get_updates_request(get_updates_request)
+        .build()
+    )
 
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("help", help_command))
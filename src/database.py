@@ -1,11 +1,18 @@
-import json
+import asyncio
+import hashlib
 import logging
-from collections.abc import Callable
-from datetime import datetime, timedelta
+import random
+import sqlite3
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
 from functools import wraps
+from io import BytesIO
 from typing import ParamSpec, TypeVar
 
 import aiosqlite
+import orjson
 from config import DATABASE_PATH, DATA_DIR
 
 logger = logging.getLogger(__name__)
@@ -19,6 +26,20 @@ class DatabaseError(Exception):
     pass
 
 
+class Record(sqlite3.Row):
+    """
+    A result row, returned as-is instead of being copied into a dict.
+
+    Supports row["column"] and row[0] like sqlite3.Row, plus dict-style get().
+    """
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except IndexError:
+            return default
+
+
 def handle_db_errors(func: Callable[P, T]) -> Callable[P, T]:
     """Decorator to handle database errors with logging."""
     @wraps(func)
@@ -34,72 +55,454 @@ def handle_db_errors(func: Callable[P, T]) -> Callable[P, T]:
     return wrapper
 
 
-async def _get_connection():
-    """Get a database connection with foreign keys enabled."""
-    db = await aiosqlite.connect(DATABASE_PATH)
-    await db.execute("PRAGMA foreign_keys = ON")
-    return db
+# Bumped by every write that changes what the cached stats queries return
+_cache_version = 0
+
+# How long /stats counts may be served from memory (in seconds)
+STATS_CACHE_TTL = 30
+
+
+def _invalidate_cache():
+    """Drop every cached query result."""
+    global _cache_version
+    _cache_version += 1
+
+
+def _ttl_cache(ttl: float) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    """Decorator to cache a query's result for `ttl` seconds or until the next write."""
+    def decorator(func: Callable[P, T]) -> Callable[P, T]:
+        cache: dict = {}
+        cache_version = _cache_version
+
+        @wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            nonlocal cache_version
+            if cache_version != _cache_version:
+                cache.clear()
+                cache_version = _cache_version
+
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            hit = cache.get(key)
+            if hit is not None and hit[1] > now:
+                return hit[0]
+
+            value = await func(*args, **kwargs)
+            # Don't store a result computed across a concurrent write
+            if cache_version == _cache_version:
+                cache[key] = (value, now + ttl)
+            return value
+        return wrapper
+    return decorator
+
+
+# Shared connection opened once by init_db() and reused by every query
+_db: aiosqlite.Connection | None = None
+_write_lock: asyncio.Lock | None = None
+
+# Read-only connections for SELECT queries, so reads don't queue behind the
+# writer's thread (WAL lets them run alongside a write)
+READ_POOL_SIZE = 4
+_read_pool: asyncio.Queue | None = None
+
+# Rows fetched per round trip to the database thread while exporting
+EXPORT_BATCH_SIZE = 256
+
+# Columns included in exports (internal ones like text_hash are left out)
+EXPORT_COLUMNS = (
+    "id, user_id, text, url, source_title, source_author, source_domain, tags, "
+    "is_favorite, times_shown, last_shown, created_at"
+)
+# Newest first; ties on created_at go by id, so each batch resumes after
+# the last (created_at, id) exported. This matches idx_quotes_user_created's order
+EXPORT_FIRST_BATCH_SQL = (
+    f"SELECT {EXPORT_COLUMNS} FROM quotes WHERE user_id = ? "
+    "ORDER BY created_at DESC, id LIMIT ?"
+)
+EXPORT_NEXT_BATCH_SQL = (
+    f"SELECT {EXPORT_COLUMNS} FROM quotes WHERE user_id = ? "
+    "AND (created_at < ? OR (created_at = ? AND id > ?)) "
+    "ORDER BY created_at DESC, id LIMIT ?"
+)
+
+# Prepared statements kept per connection, keyed by SQL text. Every query
+# here uses fixed SQL with bound parameters, so repeats skip re-parsing
+STATEMENT_CACHE_SIZE = 256
+
+# Column definitions of the quotes table, shared by init_db and the legacy rebuild
+QUOTES_SCHEMA = """(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    url TEXT,
+    source_title TEXT,
+    source_author TEXT,
+    source_domain TEXT,
+    tags TEXT,
+    text_hash BLOB,
+    is_favorite INTEGER DEFAULT 0,
+    times_shown INTEGER DEFAULT 0,
+    last_shown TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (chat_id)
+)"""
+
+# Applied once when the shared connection is opened
+CONNECTION_PRAGMAS = """
+    PRAGMA foreign_keys = ON;
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA cache_size = -64000;
+    PRAGMA busy_timeout = 5000;
+"""
+
+# Applied to each pooled read connection
+READ_CONNECTION_PRAGMAS = """
+    PRAGMA query_only = ON;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA cache_size = -16000;
+    PRAGMA busy_timeout = 5000;
+"""
+
+
+async def _get_connection() -> aiosqlite.Connection:
+    """Get the shared database connection."""
+    if _db is None:
+        raise DatabaseError("Database is not initialized. Call init_db() first.")
+    return _db
+
+
+@asynccontextmanager
+async def _read_connection() -> AsyncIterator[aiosqlite.Connection]:
+    """Borrow a read-only connection from the pool."""
+    if _read_pool is None:
+        raise DatabaseError("Database is not initialized. Call init_db() first.")
+    pool = _read_pool
+    db = await pool.get()
+    try:
+        yield db
+    finally:
+        pool.put_nowait(db)
+
+
+async def _fetch_all(sql: str, params=()) -> list:
+    """Run a SELECT on a pooled read connection and fetch every row."""
+    async with _read_connection() as db:
+        return await db.execute_fetchall(sql, params)
+
+
+async def _open_read_pool() -> asyncio.Queue:
+    """Open READ_POOL_SIZE read-only connections to the database file."""
+    uri = f"{DATABASE_PATH.resolve().as_uri()}?mode=ro"
+    pool = asyncio.Queue()
+    for _ in range(READ_POOL_SIZE):
+        db = await aiosqlite.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE)
+        db.row_factory = Record
+        await db.executescript(READ_CONNECTION_PRAGMAS)
+        pool.put_nowait(db)
+    return pool
+
+
+@asynccontextmanager
+async def _transaction() -> AsyncIterator[aiosqlite.Connection]:
+    """Serialize writes on the shared connection and commit them as one unit."""
+    db = await _get_connection()
+    async with _write_lock:
+        try:
+            yield db
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+
+async def close_db():
+    """Close the shared database connections once any in-flight queries have finished."""
+    global _db, _write_lock, _read_pool
+    _invalidate_cache()
+
+    pool = _read_pool
+    _read_pool = None
+    if pool is not None:
+        # Wait for every borrowed connection to come back before closing it
+        for _ in range(READ_POOL_SIZE):
+            await (await pool.get()).close()
+
+    if _db is None:
+        return
+
+    db, lock = _db, _write_lock
+    # Detach first so no new queries start on a connection that's closing
+    _db = None
+    _write_lock = None
+    async with lock:
+        try:
+            await db.execute("PRAGMA optimize")
+        except aiosqlite.Error as e:
+            logger.warning(f"PRAGMA optimize failed on close: {e}")
+        await db.close()
+    logger.info("Database connection closed")
+
+
+@handle_db_errors
+async def optimize_db():
+    """Let SQLite refresh query planner statistics where they've gone stale."""
+    async with _transaction() as db:
+        await db.execute("PRAGMA optimize")
 
 
 @handle_db_errors
 async def init_db():
-    """Initialize the database with required tables."""
+    """Open the shared connections and initialize the database with required tables."""
+    global _db, _write_lock, _read_pool
+
     try:
         DATA_DIR.mkdir(exist_ok=True)
     except OSError as e:
         logger.error(f"Failed to create data directory {DATA_DIR}: {e}")
         raise DatabaseError(f"Cannot create data directory: {e}") from e
 
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Enable foreign keys
-        await db.execute("PRAGMA foreign_keys = ON")
+    # Re-initializing (e.g. with a new DATABASE_PATH) replaces the old connection
+    await close_db()
+
+    db = await aiosqlite.connect(DATABASE_PATH, cached_statements=STATEMENT_CACHE_SIZE)
+    db.row_factory = Record
+    await db.executescript(CONNECTION_PRAGMAS)
+    _db = db
+    _write_lock = asyncio.Lock()
+
+    # Users table - tracks all users for sending digests
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER UNIQUE NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            digest_enabled INTEGER DEFAULT 1,
+            daily_quote_enabled INTEGER DEFAULT 1,
+            quote_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
 
-        # Users table - tracks all users for sending digests
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                chat_id INTEGER UNIQUE NOT NULL,
-                username TEXT,
-                first_name TEXT,
-                digest_enabled INTEGER DEFAULT 1,
-                daily_quote_enabled INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+    # Quotes table - now with user_id
+    await db.execute(f"CREATE TABLE IF NOT EXISTS quotes {QUOTES_SCHEMA}")
 
-        # Quotes table - now with user_id
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS quotes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                text TEXT NOT NULL,
-                url TEXT,
-                source_title TEXT,
-                source_author TEXT,
-                source_domain TEXT,
-                tags TEXT,
-                is_favorite INTEGER DEFAULT 0,
-                times_shown INTEGER DEFAULT 0,
-                last_shown TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (chat_id)
-            )
+    # Tags normalized out of the quotes.tags CSV for indexed lookups and counts
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS quote_tags (
+            quote_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (quote_id, tag_id),
+            FOREIGN KEY (quote_id) REFERENCES quotes (id) ON DELETE CASCADE,
+            FOREIGN KEY (tag_id) REFERENCES tags (id)
+        )
+    """)
+
+    # Fetched URL metadata, so repeat links skip the network across restarts
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS metadata_cache (
+            url TEXT PRIMARY KEY,
+            title TEXT,
+            author TEXT,
+            domain TEXT,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Create indexes for common queries
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_quote_tags_tag_id ON quote_tags(tag_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_chat_id ON users(chat_id)")
+
+    await db.commit()
+    logger.info("Database initialized successfully")
+
+    # Migration: add new columns to existing databases
+    await _migrate_db(db)
+
+    await _create_search_indexes(db)
+    await _create_counter_triggers(db)
+
+    # Refresh planner statistics so the new indexes get used; analysis_limit
+    # samples each index, which keeps this fast on large databases
+    await db.executescript("PRAGMA analysis_limit = 400; ANALYZE;")
+
+    # Open readers last, once the schema they query exists
+    _read_pool = await _open_read_pool()
+
+
+async def _create_search_indexes(db):
+    """Create secondary indexes and the FTS5 index used by search and tag lookups."""
+    await db.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_quotes_text_hash ON quotes(user_id, text_hash, created_at);
+
+        -- Every per-user list is "WHERE user_id = ? ORDER BY created_at DESC LIMIT n",
+        -- so these let SQLite walk the index and stop early instead of sorting
+        CREATE INDEX IF NOT EXISTS idx_quotes_user_created ON quotes(user_id, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_quotes_user_fav
+            ON quotes(user_id, is_favorite, created_at DESC) WHERE is_favorite = 1;
+        CREATE INDEX IF NOT EXISTS idx_quotes_user_lastshown ON quotes(user_id, last_shown, times_shown);
+
+        -- Superseded by the per-user indexes above (source lookups go through FTS)
+        DROP INDEX IF EXISTS idx_quotes_user_id;
+        DROP INDEX IF EXISTS idx_quotes_created_at;
+        DROP INDEX IF EXISTS idx_quotes_domain;
+        DROP INDEX IF EXISTS idx_quotes_favorite;
+        DROP INDEX IF EXISTS idx_quotes_last_shown;
+    """)
+
+    cursor = await db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'quotes_fts'"
+    )
+    row = await cursor.fetchone()
+    fts_exists = row is not None
+
+    # Older databases indexed only text and tags; drop that index and rebuild it
+    if fts_exists and "source_title" not in row[0]:
+        logger.info("Migrating database: adding source fields to the full-text index")
+        await db.executescript("""
+            DROP TRIGGER IF EXISTS quotes_fts_insert;
+            DROP TRIGGER IF EXISTS quotes_fts_delete;
+            DROP TRIGGER IF EXISTS quotes_fts_update;
+            DROP TABLE quotes_fts;
         """)
+        fts_exists = False
+
+    # External-content table: FTS stores only the index, quotes keeps the data.
+    # '_' is a token character so tags like my_tag stay a single token, and
+    # accents are folded so "cafe" finds "café".
+    await db.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS quotes_fts USING fts5(
+            text, tags, source_domain, source_title,
+            content='quotes', content_rowid='id',
+            tokenize="unicode61 remove_diacritics 2 tokenchars '_'"
+        );
+
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_insert AFTER INSERT ON quotes BEGIN
+            INSERT INTO quotes_fts(rowid, text, tags, source_domain, source_title)
+            VALUES (new.id, new.text, new.tags, new.source_domain, new.source_title);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_delete AFTER DELETE ON quotes BEGIN
+            INSERT INTO quotes_fts(quotes_fts, rowid, text, tags, source_domain, source_title)
+            VALUES ('delete', old.id, old.text, old.tags, old.source_domain, old.source_title);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS quotes_fts_update
+        AFTER UPDATE OF text, tags, source_domain, source_title ON quotes BEGIN
+            INSERT INTO quotes_fts(quotes_fts, rowid, text, tags, source_domain, source_title)
+            VALUES ('delete', old.id, old.text, old.tags, old.source_domain, old.source_title);
+            INSERT INTO quotes_fts(rowid, text, tags, source_domain, source_title)
+            VALUES (new.id, new.text, new.tags, new.source_domain, new.source_title);
+        END;
+    """)
+
+    if not fts_exists:
+        logger.info("Migrating database: building full-text index")
+        await db.execute("INSERT INTO quotes_fts(quotes_fts) VALUES ('rebuild')")
+
+    await db.commit()
 
-        # Create indexes for common queries
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_quotes_user_id ON quotes(user_id)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_quotes_created_at ON quotes(created_at)")
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_chat_id ON users(chat_id)")
 
-        await db.commit()
-        logger.info("Database initialized successfully")
+async def _create_counter_triggers(db):
+    """Keep users.quote_count in step with the quotes table, so counts are a point lookup."""
+    await db.executescript("""
+        CREATE TRIGGER IF NOT EXISTS quotes_count_insert AFTER INSERT ON quotes BEGIN
+            UPDATE users SET quote_count = quote_count + 1 WHERE chat_id = new.user_id;
+        END;
 
-        # Migration: add new columns to existing databases
-        await _migrate_db(db)
+        CREATE TRIGGER IF NOT EXISTS quotes_count_delete AFTER DELETE ON quotes BEGIN
+            UPDATE users SET quote_count = quote_count - 1 WHERE chat_id = old.user_id;
+        END;
+    """)
+    await db.commit()
+
+
+def _text_hash(text: str) -> bytes:
+    """Hash quote text for indexed duplicate lookups."""
+    return hashlib.blake2b(text.strip().encode(), digest_size=16).digest()
+
+
+def _sqlite_timestamp(ago: timedelta) -> str:
+    """Format a UTC time `ago` in the past the way CURRENT_TIMESTAMP stores it."""
+    return (datetime.now(UTC) - ago).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _fts_phrase(term: str) -> str:
+    """Quote a user-supplied term so FTS5 treats it as a literal phrase."""
+    return '"' + term.replace('"', '""') + '"'
 
 
 async def _migrate_db(db):
-    """Add new columns if they don't exist (for existing databases)."""
+    """Add new columns if they don't exist (for existing databases), in one transaction."""
+    await _rebuild_legacy_quotes(db)
+
+    await db.execute("BEGIN")
+    try:
+        await _run_migrations(db)
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+
+
+async def _rebuild_legacy_quotes(db):
+    """
+    Rebuild a quotes table whose user_id was bolted on by ALTER TABLE (nullable,
+    DEFAULT 0) into the current schema, keeping every row.
+
+    Follows SQLite's procedure for schema changes ALTER TABLE can't make:
+    foreign keys off, copy into a new table, swap it in, re-enable.
+    """
+    cursor = await db.execute("PRAGMA table_info(quotes)")
+    old_columns = {row["name"]: row for row in await cursor.fetchall()}
+    if "user_id" in old_columns and old_columns["user_id"]["notnull"]:
+        return
+
+    logger.info("Migrating database: rebuilding quotes table with a NOT NULL user_id")
+    await db.execute("PRAGMA foreign_keys = OFF")
+    try:
+        await db.execute("BEGIN")
+        await db.execute(f"CREATE TABLE quotes_new {QUOTES_SCHEMA}")
+        cursor = await db.execute("PRAGMA table_info(quotes_new)")
+        new_columns = [row["name"] for row in await cursor.fetchall()]
+
+        # Quotes from before multi-user support belong to no chat; keep them as user 0
+        copied = [c for c in new_columns if c in old_columns or c == "user_id"]
+        selected = []
+        for column in copied:
+            if column != "user_id":
+                selected.append(column)
+            elif "user_id" in old_columns:
+                selected.append("COALESCE(user_id, 0)")
+            else:
+                selected.append("0")
+        await db.execute(
+            f"INSERT INTO quotes_new ({', '.join(copied)}) SELECT {', '.join(selected)} FROM quotes"
+        )
+        await db.execute("DROP TABLE quotes")
+        await db.execute("ALTER TABLE quotes_new RENAME TO quotes")
+        # The FTS triggers went with the old table; rebuild the index from scratch
+        await db.execute("DROP TABLE IF EXISTS quotes_fts")
+        await db.execute("DELETE FROM quote_tags WHERE quote_id NOT IN (SELECT id FROM quotes)")
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    finally:
+        await db.execute("PRAGMA foreign_keys = ON")
+
+
+async def _run_migrations(db):
     cursor = await db.execute("PRAGMA table_info(quotes)")
     columns = {row[1] for row in await cursor.fetchall()}
 
@@ -108,6 +511,7 @@ async def _migrate_db(db):
         ("times_shown", "INTEGER DEFAULT 0"),
         ("last_shown", "TIMESTAMP"),
         ("user_id", "INTEGER DEFAULT 0"),
+        ("text_hash", "BLOB"),
     ]
 
     for col_name, col_type in migrations:
@@ -115,7 +519,72 @@ async def _migrate_db(db):
             logger.info(f"Migrating database: adding column {col_name}")
             await db.execute(f"ALTER TABLE quotes ADD COLUMN {col_name} {col_type}")
 
-    await db.commit()
+    cursor = await db.execute("PRAGMA table_info(users)")
+    user_columns = {row[1] for row in await cursor.fetchall()}
+    if "quote_count" not in user_columns:
+        logger.info("Migrating database: adding column quote_count to users")
+        await db.execute("ALTER TABLE users ADD COLUMN quote_count INTEGER DEFAULT 0")
+        await db.execute(
+            "UPDATE users SET quote_count = (SELECT COUNT(*) FROM quotes WHERE user_id = users.chat_id)"
+        )
+
+    # Backfill text_hash for quotes saved before it existed
+    cursor = await db.execute("SELECT id, text FROM quotes WHERE text_hash IS NULL")
+    rows = await cursor.fetchall()
+    if rows:
+        logger.info(f"Migrating database: hashing {len(rows)} quotes")
+        await db.executemany(
+            "UPDATE quotes SET text_hash = ? WHERE id = ?",
+            [(_text_hash(row["text"]), row["id"]) for row in rows]
+        )
+
+    # Backfill quote_tags from the legacy CSV column, splitting it inside SQLite
+    cursor = await db.execute("SELECT 1 FROM quote_tags LIMIT 1")
+    if await cursor.fetchone() is None:
+        cursor = await db.execute(
+            "SELECT COUNT(*) FROM quotes WHERE tags IS NOT NULL AND tags != ''"
+        )
+        (tagged,) = await cursor.fetchone()
+        if tagged:
+            logger.info(f"Migrating database: linking tags for {tagged} quotes")
+            await _link_csv_tags(db, after_id=0)
+
+
+# Splits quotes.tags CSV values into (quote_id, tag) rows for quotes after :after_id
+_SPLIT_TAGS_CTE = """
+    WITH RECURSIVE split(quote_id, tag, rest) AS (
+        SELECT id, '', tags || ',' FROM quotes
+        WHERE id > :after_id AND tags IS NOT NULL AND tags != ''
+        UNION ALL
+        SELECT quote_id,
+               trim(substr(rest, 1, instr(rest, ',') - 1)),
+               substr(rest, instr(rest, ',') + 1)
+        FROM split WHERE rest != ''
+    )
+"""
+
+
+async def _link_csv_tags(db, after_id: int):
+    """Create tags and quote_tags rows from the CSV tags of every quote after after_id."""
+    params = {"after_id": after_id}
+    await db.execute(
+        _SPLIT_TAGS_CTE + "INSERT OR IGNORE INTO tags (name) SELECT DISTINCT tag FROM split WHERE tag != ''",
+        params
+    )
+    await db.execute(
+        _SPLIT_TAGS_CTE + """INSERT OR IGNORE INTO quote_tags (quote_id, tag_id)
+        SELECT split.quote_id, tags.id FROM split JOIN tags ON tags.name = split.tag""",
+        params
+    )
+
+
+async def _link_tags(db, quote_id: int, tags: list):
+    """Create any missing tags and link them to a quote."""
+    await db.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", ((tag,) for tag in tags))
+    await db.executemany(
+        "INSERT OR IGNORE INTO quote_tags (quote_id, tag_id) SELECT ?, id FROM tags WHERE name = ?",
+        ((quote_id, tag) for tag in tags)
+    )
 
 
 # ============ User functions ============
@@ -123,108 +592,154 @@ async def _migrate_db(db):
 @handle_db_errors
 async def register_user(chat_id: int, username: str = None, first_name: str = None) -> bool:
     """Register a new user or update existing. Returns True if new user."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("PRAGMA foreign_keys = ON")
-        cursor = await db.execute("SELECT chat_id FROM users WHERE chat_id = ?", (chat_id,))
-        exists = await cursor.fetchone()
-
-        if exists:
-            await db.execute(
-                "UPDATE users SET username = ?, first_name = ? WHERE chat_id = ?",
-                (username, first_name, chat_id)
-            )
-            await db.commit()
-            logger.debug(f"Updated user {chat_id}")
-            return False
-        else:
+    # Existing users are the common case, so try the update first
+    async with _transaction() as db:
+        cursor = await db.execute(
+            "UPDATE users SET username = ?, first_name = ? WHERE chat_id = ?",
+            (username, first_name, chat_id)
+        )
+        exists = cursor.rowcount > 0
+        if not exists:
             await db.execute(
                 "INSERT INTO users (chat_id, username, first_name) VALUES (?, ?, ?)",
                 (chat_id, username, first_name)
             )
-            await db.commit()
-            logger.info(f"Registered new user {chat_id} ({username})")
-            return True
+
+    if exists:
+        logger.debug(f"Updated user {chat_id}")
+        return False
+    logger.info(f"Registered new user {chat_id} ({username})")
+    return True
 
 
 @handle_db_errors
 async def get_all_users() -> list:
     """Get all registered users."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT * FROM users")
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+    return await _fetch_all("SELECT * FROM users")
 
 
 @handle_db_errors
 async def get_users_for_digest() -> list:
     """Get users who have digest enabled."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT * FROM users WHERE digest_enabled = 1")
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+    return await _fetch_all("SELECT * FROM users WHERE digest_enabled = 1")
 
 
 @handle_db_errors
 async def get_users_for_daily_quote() -> list:
     """Get users who have daily quote enabled."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT * FROM users WHERE daily_quote_enabled = 1")
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+    return await _fetch_all("SELECT * FROM users WHERE daily_quote_enabled = 1")
 
 
 # ============ Quote functions ============
 
 @handle_db_errors
 async def save_quote(user_id: int, text: str, url: str = None, title: str = None,
-                     author: str = None, domain: str = None, tags: list = None) -> int:
-    """Save a new quote for a user."""
+                     author: str = None, domain: str = None, tags: list = None,
+                     dedupe_minutes: int | None = None) -> int | None:
+    """
+    Save a new quote for a user.
+
+    With dedupe_minutes set, the quote is only inserted if the same text wasn't
+    saved in that window; returns None when it was a duplicate.
+    """
     if not text or not text.strip():
         raise ValueError("Quote text cannot be empty")
 
     tags_str = ",".join(tags) if tags else None
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("PRAGMA foreign_keys = ON")
-        cursor = await db.execute(
-            """INSERT INTO quotes (user_id, text, url, source_title, source_author, source_domain, tags)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (user_id, text.strip(), url, title, author, domain, tags_str)
+    text_hash = _text_hash(text)
+    # The duplicate check and the insert are one statement, so two copies of
+    # the same message arriving together can't both be saved
+    cutoff = None if dedupe_minutes is None else _sqlite_timestamp(timedelta(minutes=dedupe_minutes))
+    async with _transaction() as db:
+        rows = await db.execute_fetchall(
+            """INSERT INTO quotes (user_id, text, url, source_title, source_author, source_domain,
+                                   tags, text_hash)
+               SELECT :user_id, :text, :url, :title, :author, :domain, :tags, :text_hash
+               WHERE :cutoff IS NULL OR NOT EXISTS (
+                   SELECT 1 FROM quotes
+                   WHERE user_id = :user_id AND text_hash = :text_hash AND created_at >= :cutoff
+               )
+               RETURNING id""",
+            {
+                "user_id": user_id, "text": text.strip(), "url": url, "title": title,
+                "author": author, "domain": domain, "tags": tags_str,
+                "text_hash": text_hash, "cutoff": cutoff,
+            }
         )
-        await db.commit()
-        quote_id = cursor.lastrowid
-        logger.debug(f"Saved quote {quote_id} for user {user_id}")
-        return quote_id
+        if not rows:
+            logger.debug(f"Skipped duplicate quote for user {user_id}")
+            return None
+
+        quote_id = rows[0][0]
+        if tags:
+            await _link_tags(db, quote_id, tags)
+
+    _invalidate_cache()
+    logger.debug(f"Saved quote {quote_id} for user {user_id}")
+    return quote_id
+
+
+@handle_db_errors
+async def save_quotes_bulk(user_id: int, quotes: list[dict]) -> int:
+    """
+    Save many quotes for a user in one transaction (one commit for the whole batch).
+
+    Each dict takes save_quote's keyword arguments (text, url, title, author,
+    domain, tags). Returns the number of quotes saved.
+    """
+    rows = []
+    for quote in quotes:
+        text = quote.get("text")
+        if not text or not text.strip():
+            raise ValueError("Quote text cannot be empty")
+        tags = quote.get("tags")
+        rows.append((
+            user_id, text.strip(), quote.get("url"), quote.get("title"), quote.get("author"),
+            quote.get("domain"), ",".join(tags) if tags else None, _text_hash(text),
+        ))
+    if not rows:
+        return 0
+
+    async with _transaction() as db:
+        # Rowids are assigned above the current max while we hold the write lock
+        last_id = (await db.execute_fetchall("SELECT COALESCE(MAX(id), 0) FROM quotes"))[0][0]
+        await db.executemany(
+            """INSERT INTO quotes (user_id, text, url, source_title, source_author, source_domain,
+                                   tags, text_hash)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+        await _link_csv_tags(db, after_id=last_id)
+
+    _invalidate_cache()
+    logger.info(f"Saved {len(rows)} quotes for user {user_id}")
+    return len(rows)
 
 
 @handle_db_errors
 async def delete_quote(user_id: int, quote_id: int) -> bool:
     """Delete a quote by ID. Returns True if deleted."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _transaction() as db:
         cursor = await db.execute(
             "DELETE FROM quotes WHERE id = ? AND user_id = ?",
             (quote_id, user_id)
         )
-        await db.commit()
         deleted = cursor.rowcount > 0
-        if deleted:
-            logger.debug(f"Deleted quote {quote_id} for user {user_id}")
-        return deleted
+
+    if deleted:
+        _invalidate_cache()
+        logger.debug(f"Deleted quote {quote_id} for user {user_id}")
+    return deleted
 
 
 @handle_db_errors
-async def get_quote_by_id(user_id: int, quote_id: int) -> dict | None:
+async def get_quote_by_id(user_id: int, quote_id: int) -> Record | None:
     """Get a quote by ID for a specific user."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM quotes WHERE id = ? AND user_id = ?",
-            (quote_id, user_id)
-        )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
+    rows = await _fetch_all(
+        "SELECT * FROM quotes WHERE id = ? AND user_id = ?",
+        (quote_id, user_id)
+    )
+    return rows[0] if rows else None
 
 
 @handle_db_errors
@@ -238,99 +753,130 @@ async def get_random_quotes(user_id: int, n: int = 10, use_spaced_repetition: bo
     3. Haven't been shown in 7+ days
     4. All others, sorted by times_shown (least shown first)
     """
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-
-        if use_spaced_repetition:
-            cursor = await db.execute("""
-                SELECT * FROM quotes
-                WHERE user_id = ?
-                ORDER BY
-                    CASE
-                        WHEN last_shown IS NULL THEN 0
-                        WHEN last_shown < datetime('now', '-30 days') THEN 1
-                        WHEN last_shown < datetime('now', '-7 days') THEN 2
-                        ELSE 3
-                    END,
-                    times_shown ASC,
-                    RANDOM()
-                LIMIT ?
-            """, (user_id, n))
-        else:
-            cursor = await db.execute(
-                "SELECT * FROM quotes WHERE user_id = ? ORDER BY RANDOM() LIMIT ?",
-                (user_id, n)
-            )
-
-        rows = await cursor.fetchall()
-        quotes = [dict(row) for row in rows]
-
-        # Update last_shown and times_shown for retrieved quotes
-        if quotes:
-            quote_ids = [q["id"] for q in quotes]
-            placeholders = ",".join("?" * len(quote_ids))
-            await db.execute(f"""
-                UPDATE quotes
-                SET last_shown = CURRENT_TIMESTAMP, times_shown = times_shown + 1
-                WHERE id IN ({placeholders})
-            """, quote_ids)
-            await db.commit()
-
-        return quotes
+    if not use_spaced_repetition:
+        return await _sample_random_quotes(user_id, n)
+
+    # Pick and mark the quotes as shown under the write lock, so a concurrent
+    # caller can never be handed the same "least recently shown" quotes
+    async with _transaction() as db:
+        id_rows = await db.execute_fetchall("""
+            SELECT id FROM quotes
+            WHERE user_id = :user_id
+            ORDER BY
+                CASE
+                    WHEN last_shown IS NULL THEN 0
+                    WHEN last_shown < :month_ago THEN 1
+                    WHEN last_shown < :week_ago THEN 2
+                    ELSE 3
+                END,
+                times_shown ASC,
+                RANDOM()
+            LIMIT :n
+        """, {
+            "user_id": user_id,
+            "n": n,
+            "month_ago": _sqlite_timestamp(timedelta(days=30)),
+            "week_ago": _sqlite_timestamp(timedelta(days=7)),
+        })
+        ids = [row[0] for row in id_rows]
+        rows = await _mark_shown(db, ids)
+
+    # RETURNING yields rows in table order; put them back in priority order
+    position = {quote_id: i for i, quote_id in enumerate(ids)}
+    rows.sort(key=lambda row: position[row["id"]])
+    return rows
+
+
+async def _sample_random_quotes(user_id: int, n: int) -> list:
+    """Pick n of a user's quotes uniformly at random and mark them as shown."""
+    async with _transaction() as db:
+        # Reading ids off the user_id index and sampling them here avoids
+        # having SQLite sort every row by RANDOM()
+        id_rows = await db.execute_fetchall("SELECT id FROM quotes WHERE user_id = ?", (user_id,))
+        ids = random.sample([row[0] for row in id_rows], min(n, len(id_rows)))
+        rows = await _mark_shown(db, ids)
+
+    random.shuffle(rows)
+    return rows
+
+
+async def _mark_shown(db, ids: list[int]) -> list:
+    """Bump last_shown and times_shown for the given quotes and return them (in table order)."""
+    if not ids:
+        return []
+    # Pass the ids as one JSON array so the SQL text (and the cached
+    # prepared statement) is the same whatever n is
+    return await db.execute_fetchall(
+        """UPDATE quotes
+           SET last_shown = CURRENT_TIMESTAMP, times_shown = times_shown + 1
+           WHERE id IN (SELECT value FROM json_each(?))
+           RETURNING *""",
+        (orjson.dumps(ids).decode(),)
+    )
 
 
 @handle_db_errors
 async def get_last_quotes(user_id: int, n: int = 5) -> list:
     """Get the most recently added quotes for a user."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM quotes WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
-            (user_id, n)
-        )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+    return await _fetch_all(
+        "SELECT * FROM quotes WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+        (user_id, n)
+    )
 
 
 @handle_db_errors
+@_ttl_cache(STATS_CACHE_TTL)
 async def get_quote_count(user_id: int) -> int:
     """Get total number of quotes for a user."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM quotes WHERE user_id = ?",
-            (user_id,)
-        )
-        row = await cursor.fetchone()
-        return row[0]
+    # Read the trigger-maintained counter; legacy quotes (user 0) have no users row to count on
+    rows = await _fetch_all(
+        """SELECT COALESCE(
+               (SELECT quote_count FROM users WHERE chat_id = ?),
+               (SELECT COUNT(*) FROM quotes WHERE user_id = ?)
+           )""",
+        (user_id, user_id)
+    )
+    return rows[0][0]
 
 
 @handle_db_errors
+@_ttl_cache(STATS_CACHE_TTL)
+async def get_favorite_count(user_id: int) -> int:
+    """Get number of favorite quotes for a user."""
+    rows = await _fetch_all(
+        "SELECT COUNT(*) FROM quotes WHERE user_id = ? AND is_favorite = 1",
+        (user_id,)
+    )
+    return rows[0][0]
+
+
+@handle_db_errors
+@_ttl_cache(STATS_CACHE_TTL)
 async def get_quotes_this_week(user_id: int) -> int:
     """Get number of quotes added in the last 7 days."""
-    week_ago = datetime.now() - timedelta(days=7)
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM quotes WHERE user_id = ? AND created_at >= ?",
-            (user_id, week_ago.isoformat())
-        )
-        row = await cursor.fetchone()
-        return row[0]
+    rows = await _fetch_all(
+        "SELECT COUNT(*) FROM quotes WHERE user_id = ? AND created_at >= ?",
+        (user_id, _sqlite_timestamp(timedelta(days=7)))
+    )
+    return rows[0][0]
 
 
 @handle_db_errors
 async def search_quotes(user_id: int, keyword: str) -> list:
-    """Search quotes by keyword (case-insensitive)."""
+    """Search quotes by keyword (case- and accent-insensitive, matches word prefixes, best match first)."""
     if not keyword or not keyword.strip():
         return []
 
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM quotes WHERE user_id = ? AND text LIKE ? ORDER BY created_at DESC LIMIT 10",
-            (user_id, f"%{keyword.strip()}%")
-        )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+    # Every word must match the start of a word in the quote text
+    match = " ".join(f"{_fts_phrase(word)}*" for word in keyword.split())
+
+    return await _fetch_all(
+        """SELECT q.* FROM quotes q
+           JOIN quotes_fts ON quotes_fts.rowid = q.id
+           WHERE quotes_fts MATCH ? AND q.user_id = ?
+           ORDER BY quotes_fts.rank, q.created_at DESC LIMIT 10""",
+        (f"text : ({match})", user_id)
+    )
 
 
 @handle_db_errors
@@ -339,116 +885,142 @@ async def get_quotes_by_tag(user_id: int, tag: str) -> list:
     if not tag or not tag.strip():
         return []
 
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM quotes WHERE user_id = ? AND tags LIKE ? ORDER BY created_at DESC LIMIT 10",
-            (user_id, f"%{tag.strip()}%")
-        )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+    return await _fetch_all(
+        """SELECT q.* FROM quotes q
+           JOIN quote_tags qt ON qt.quote_id = q.id
+           JOIN tags t ON t.id = qt.tag_id
+           WHERE t.name = ? AND q.user_id = ?
+           ORDER BY q.created_at DESC LIMIT 10""",
+        (tag.strip(), user_id)
+    )
 
 
 @handle_db_errors
 async def get_quotes_by_source(user_id: int, domain: str) -> list:
-    """Get quotes from a specific source domain."""
+    """Get quotes whose source domain or title matches (word prefixes, like search)."""
     if not domain or not domain.strip():
         return []
 
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM quotes WHERE user_id = ? AND source_domain LIKE ? ORDER BY created_at DESC LIMIT 10",
-            (user_id, f"%{domain.strip()}%")
-        )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+    match = " ".join(f"{_fts_phrase(word)}*" for word in domain.split())
+
+    return await _fetch_all(
+        """SELECT q.* FROM quotes q
+           JOIN quotes_fts ON quotes_fts.rowid = q.id
+           WHERE quotes_fts MATCH ? AND q.user_id = ?
+           ORDER BY q.created_at DESC LIMIT 10""",
+        (f"{{source_domain source_title}} : ({match})", user_id)
+    )
 
 
 @handle_db_errors
 async def toggle_favorite(user_id: int, quote_id: int) -> bool | None:
     """Toggle favorite status. Returns new status, or None if quote not found."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute(
-            "SELECT is_favorite FROM quotes WHERE id = ? AND user_id = ?",
+    async with _transaction() as db:
+        rows = await db.execute_fetchall(
+            """UPDATE quotes SET is_favorite = CASE WHEN is_favorite THEN 0 ELSE 1 END
+               WHERE id = ? AND user_id = ?
+               RETURNING is_favorite""",
             (quote_id, user_id)
         )
-        row = await cursor.fetchone()
-        if not row:
-            return None
+    if not rows:
+        return None
 
-        new_status = 0 if row[0] else 1
-        await db.execute(
-            "UPDATE quotes SET is_favorite = ? WHERE id = ? AND user_id = ?",
-            (new_status, quote_id, user_id)
-        )
-        await db.commit()
-        logger.debug(f"Toggled favorite for quote {quote_id}: {bool(new_status)}")
-        return bool(new_status)
+    new_status = rows[0][0]
+    _invalidate_cache()
+
+    logger.debug(f"Toggled favorite for quote {quote_id}: {bool(new_status)}")
+    return bool(new_status)
 
 
 @handle_db_errors
-async def get_favorite_quotes(user_id: int) -> list:
-    """Get all favorite quotes for a user."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM quotes WHERE user_id = ? AND is_favorite = 1 ORDER BY created_at DESC",
-            (user_id,)
-        )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+async def get_favorite_quotes(user_id: int, limit: int | None = None) -> list:
+    """Get favorite quotes for a user, newest first (all of them if no limit)."""
+    return await _fetch_all(
+        "SELECT * FROM quotes WHERE user_id = ? AND is_favorite = 1 ORDER BY created_at DESC LIMIT ?",
+        (user_id, -1 if limit is None else limit)
+    )
 
 
 @handle_db_errors
+@_ttl_cache(STATS_CACHE_TTL)
 async def get_top_tags(user_id: int, limit: int = 5) -> list:
     """Get the most used tags for a user."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute(
-            "SELECT tags FROM quotes WHERE user_id = ? AND tags IS NOT NULL",
-            (user_id,)
-        )
-        rows = await cursor.fetchall()
+    rows = await _fetch_all(
+        """SELECT t.name, COUNT(*) AS uses FROM quote_tags qt
+           JOIN tags t ON t.id = qt.tag_id
+           JOIN quotes q ON q.id = qt.quote_id
+           WHERE q.user_id = ?
+           GROUP BY t.id
+           ORDER BY uses DESC, t.name
+           LIMIT ?""",
+        (user_id, limit)
+    )
+    return [(row[0], row[1]) for row in rows]
 
-    tag_counts = {}
-    for row in rows:
-        if row[0]:
-            for tag in row[0].split(","):
-                tag = tag.strip()
-                if tag:
-                    tag_counts[tag] = tag_counts.get(tag, 0) + 1
 
-    sorted_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)
-    return sorted_tags[:limit]
+@handle_db_errors
+async def get_stored_metadata(url: str, max_age: timedelta) -> Record | None:
+    """Get metadata stored for a URL if it was fetched within max_age."""
+    rows = await _fetch_all(
+        "SELECT title, author, domain FROM metadata_cache WHERE url = ? AND fetched_at >= ?",
+        (url, _sqlite_timestamp(max_age))
+    )
+    return rows[0] if rows else None
 
 
 @handle_db_errors
-async def is_duplicate(user_id: int, text: str, minutes: int = 1) -> bool:
-    """Check if an identical quote was saved recently."""
-    if not text:
-        return False
-
-    cutoff = datetime.now() - timedelta(minutes=minutes)
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM quotes WHERE user_id = ? AND text = ? AND created_at >= ?",
-            (user_id, text.strip(), cutoff.isoformat())
+async def store_metadata(url: str, title: str | None, author: str | None, domain: str):
+    """Store (or refresh) fetched metadata for a URL."""
+    async with _transaction() as db:
+        await db.execute(
+            """INSERT INTO metadata_cache (url, title, author, domain) VALUES (?, ?, ?, ?)
+               ON CONFLICT(url) DO UPDATE SET
+                   title = excluded.title, author = excluded.author,
+                   domain = excluded.domain, fetched_at = CURRENT_TIMESTAMP""",
+            (url, title, author, domain)
         )
-        row = await cursor.fetchone()
-        return row[0] > 0
 
 
-@handle_db_errors
-async def export_all_quotes(user_id: int) -> str:
-    """Export all quotes for a user as JSON string."""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM quotes WHERE user_id = ? ORDER BY created_at DESC",
-            (user_id,)
-        )
-        rows = await cursor.fetchall()
-        quotes = [dict(row) for row in rows]
+async def iter_quote_export(user_id: int) -> AsyncIterator[bytes]:
+    """
+    Yield a user's quotes as a JSON array, one encoded row per chunk, without building the list.
 
-    logger.info(f"Exported {len(quotes)} quotes for user {user_id}")
-    return json.dumps(quotes, indent=2, default=str)
+    Rows are read EXPORT_BATCH_SIZE at a time, each batch on a connection
+    borrowed only for that query, so a consumer that stops early (or never
+    finishes) doesn't keep a pooled connection checked out and block close_db.
+    """
+    count = 0
+    last = None  # The last row yielded, which the next batch resumes after
+    try:
+        yield b"["
+        while True:
+            if last is None:
+                rows = await _fetch_all(EXPORT_FIRST_BATCH_SQL, (user_id, EXPORT_BATCH_SIZE))
+            else:
+                rows = await _fetch_all(EXPORT_NEXT_BATCH_SQL, (
+                    user_id, last["created_at"], last["created_at"], last["id"], EXPORT_BATCH_SIZE
+                ))
+            for row in rows:
+                prefix = b"," if count else b""
+                # orjson calls dict() on each Record as it meets it and emits bytes directly
+                yield prefix + orjson.dumps(row, default=dict)
+                count += 1
+            if len(rows) < EXPORT_BATCH_SIZE:
+                break
+            last = rows[-1]
+        yield b"]"
+    except aiosqlite.Error as e:
+        logger.error(f"Database error in iter_quote_export: {e}")
+        raise DatabaseError(f"Database operation failed: {e}") from e
+
+    logger.info(f"Exported {count} quotes for user {user_id}")
+
+
+async def export_all_quotes(user_id: int) -> BytesIO:
+    """Export all quotes for a user as a JSON document in a file-like buffer."""
+    # Not wrapped in handle_db_errors: iter_quote_export already logs and raises DatabaseError
+    buffer = BytesIO()
+    async for chunk in iter_quote_export(user_id):
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
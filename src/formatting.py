@@ -0,0 +1,127 @@
+from datetime import datetime
+from functools import lru_cache
+
+# Telegram allows 4096 characters per message; leave room for formatting.
+# Telegram counts UTF-16 code units, so emoji outside the BMP count twice
+MAX_MESSAGE_LENGTH = 4000
+
+
+def message_length(text: str) -> int:
+    """Length of text as Telegram counts it, in UTF-16 code units."""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def format_relative_time(timestamp_str: str) -> str:
+    """Format a timestamp as relative time (e.g., '2 days ago')."""
+    try:
+        # Parse the timestamp
+        timestamp = datetime.fromisoformat(timestamp_str)
+        now = datetime.now()
+        delta = now - timestamp
+
+        # Format based on time difference
+        if delta.days == 0:
+            hours = int(delta.seconds / 3600)
+            if hours == 0:
+                minutes = int(delta.seconds / 60)
+                if minutes == 0:
+                    return "just now"
+                return f"{minutes}m ago"
+            return f"{hours}h ago"
+        elif delta.days == 1:
+            return "yesterday"
+        elif delta.days < 7:
+            return f"{delta.days}d ago"
+        elif delta.days < 30:
+            weeks = int(delta.days / 7)
+            return f"{weeks}w ago"
+        elif delta.days < 365:
+            months = int(delta.days / 30)
+            return f"{months}mo ago"
+        else:
+            years = int(delta.days / 365)
+            return f"{years}y ago"
+    except (ValueError, TypeError):
+        return ""
+
+
+def format_quote(quote: dict, show_id: bool = False) -> str:
+    """Format a quote for display."""
+    text = _format_quote_body(
+        quote["id"] if show_id else None,
+        quote["text"],
+        bool(quote.get("is_favorite")),
+        quote.get("source_title"),
+        quote.get("source_author"),
+        quote.get("source_domain"),
+        quote.get("url"),
+        quote.get("tags"),
+    )
+
+    # Add timestamp (not cached, it depends on the current time)
+    if quote.get("created_at"):
+        relative_time = format_relative_time(quote["created_at"])
+        if relative_time:
+            text += f"\n  📅 Saved {relative_time}"
+
+    return text
+
+
+@lru_cache(maxsize=1024)
+def _format_quote_body(quote_id: int | None, quote_text: str, is_favorite: bool,
+                       source_title: str | None, source_author: str | None,
+                       source_domain: str | None, url: str | None, tags: str | None) -> str:
+    """Format everything but the timestamp; keyed on every displayed field, so edits never hit stale entries."""
+    prefix = f"[#{quote_id}] " if quote_id is not None else ""
+    fav = " ⭐" if is_favorite else ""
+    text = f'{prefix}"{quote_text}"{fav}'
+
+    source_parts = []
+    if source_title:
+        source_parts.append(source_title)
+    if source_author:
+        source_parts.append(f"by {source_author}")
+    elif source_domain:
+        source_parts.append(f"({source_domain})")
+
+    if source_parts:
+        text += f"\n  -- {' '.join(source_parts)}"
+
+    if url:
+        text += f"\n  {url}"
+
+    if tags:
+        text += f"\n  {' '.join(f'#{t}' for t in tags.split(','))}"
+
+    return text
+
+
+def format_quote_list(header: str, quotes: list, footer: str = "") -> str:
+    """Format quotes under a header, stopping before the message length limit."""
+    parts = [header]
+    size = message_length(header) + message_length(footer)
+    for quote in quotes:
+        entry = f"{format_quote(quote, show_id=True)}\n\n"
+        entry_length = message_length(entry)
+        if size + entry_length > MAX_MESSAGE_LENGTH:
+            if len(parts) == 1:
+                # Always show at least part of the first quote
+                parts.append(truncate(entry, MAX_MESSAGE_LENGTH - size))
+            break
+        parts.append(entry)
+        size += entry_length
+    parts.append(footer)
+    return "".join(parts)
+
+
+def truncate(text: str, length: int) -> str:
+    """Truncate text to length (in message_length units) with ellipsis."""
+    if message_length(text) <= length:
+        return text
+    if text.isascii():
+        return text[:length - 3] + "..."
+    # Cut on a code unit boundary; a surrogate pair split in half is dropped
+    cut = text.encode("utf-16-le")[:(length - 3) * 2]
+    return cut.decode("utf-16-le", errors="ignore") + "..."
@@ -1,11 +1,20 @@
 import asyncio
+import html
 import logging
+import random
 import re
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from urllib.parse import urlparse
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode, urlparse, urlsplit, urlunsplit
+from weakref import WeakValueDictionary
 
 import httpx
 from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector
+from bs4.filter import ElementFilter
 
 logger = logging.getLogger(__name__)
 
@@ -22,18 +31,135 @@ URL_PATTERN = re.compile(
 # Maximum URL length to prevent abuse
 MAX_URL_LENGTH = 2048
 
+# Only the start of a page is read: <title> and <meta> tags live in <head>,
+# and bylines are usually near the top of <body>
+MAX_HEAD_BYTES = 64 * 1024
+MAX_PAGE_BYTES = 256 * 1024
+READ_CHUNK_SIZE = 8192
+HEAD_END = b"</head>"
+
+# <meta> attributes naming the author, in order of preference
+AUTHOR_META = (
+    ("name", "author"),
+    ("property", "article:author"),
+    ("property", "og:article:author"),
+    ("name", "twitter:creator"),
+)
+# Elements that can carry a byline, in order of preference
+AUTHOR_CLASSES = ("author", "byline", "author-name", "post-author")
+# "By ", "Written by " or "Author: " in front of a byline, in any case
+BYLINE_PREFIX = re.compile(r'^(?:(?:written\s+)?by\s+|author:\s*)', re.IGNORECASE)
+
+# Most pages name their title and author in <meta> tags, which these read
+# straight from <head> without building a soup
+HEAD_TITLE = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+HEAD_META = re.compile(r"""<meta\b((?:[^>"']|"[^"]*"|'[^']*')*)>""", re.IGNORECASE)
+TAG_ATTR = re.compile(r"""([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?""")
+# Comments, scripts and styles, whose text can look like tags but isn't
+HEAD_NOISE = re.compile(r"<!--.*?-->|<(script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+
+# One pooled client shared by every fetch, so repeat hosts reuse connections
+# and TLS sessions; created on first use and closed by close_client()
+_client: httpx.AsyncClient | None = None
+CLIENT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+CLIENT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+# Recently fetched metadata, keyed by normalized URL (most recent last)
+METADATA_CACHE_SIZE = 1024
+METADATA_CACHE_TTL = 24 * 60 * 60  # seconds
+_metadata_cache: OrderedDict[str, tuple[float, "ArticleMetadata"]] = OrderedDict()
+
 # Retry configuration
 MAX_RETRIES = 3
 INITIAL_BACKOFF = 0.5  # seconds
+BACKOFF_JITTER = 0.3  # seconds, so many saves of one link don't retry in lockstep
+MAX_RETRY_AFTER = 30.0  # seconds; a 429 asking us to wait longer isn't retried
 
+# Requests in flight to any one host, so bursts of shares don't get us rate limited
+HOST_CONCURRENCY = 4
+# Dropped once no fetch holds them (each test runs its own event loop)
+_host_slots: WeakValueDictionary[str, asyncio.Semaphore] = WeakValueDictionary()
 
-@dataclass
+
+# Frozen: cached instances are shared by every caller asking for the same URL
+@dataclass(frozen=True, slots=True)
 class ArticleMetadata:
     title: str | None
     author: str | None
     domain: str
 
 
+class _MetadataFilter(ElementFilter):
+    """Only build <title>, <meta> and byline elements (with their contents) into the soup."""
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        if name in ("title", "meta"):
+            return True
+        # class hasn't been split into a list yet while the page is parsed
+        classes = (attrs or {}).get("class") or ""
+        if isinstance(classes, str):
+            classes = classes.split()
+        return any(cls in AUTHOR_CLASSES for cls in classes)
+
+    def allow_string_creation(self, string) -> bool:
+        return False  # Text outside the elements above is never read
+
+
+_METADATA_ONLY = _MetadataFilter()
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=CLIENT_TIMEOUT,
+            limits=CLIENT_LIMITS,
+            http2=True,
+            headers={"User-Agent": "Mozilla/5.0 (compatible; Flashback Bot/1.0)"},
+        )
+    return _client
+
+
+async def close_client():
+    """Close the shared HTTP client."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL for caching: drop the fragment and tracking parameters, and sort the rest."""
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    query = urlencode(sorted(param for param in params if not param[0].lower().startswith("utm_")))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+def get_cached_metadata(url: str) -> ArticleMetadata | None:
+    """Get metadata fetched for this URL within the TTL, if any."""
+    key = normalize_url(url)
+    entry = _metadata_cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        del _metadata_cache[key]
+        return None
+    _metadata_cache.move_to_end(key)
+    return entry[1]
+
+
+def cache_metadata(url: str, metadata: ArticleMetadata):
+    """Remember metadata for a URL, evicting the least recently used entry when full."""
+    key = normalize_url(url)
+    _metadata_cache[key] = (time.monotonic() + METADATA_CACHE_TTL, metadata)
+    _metadata_cache.move_to_end(key)
+    if len(_metadata_cache) > METADATA_CACHE_SIZE:
+        _metadata_cache.popitem(last=False)
+
+
 def is_valid_url(url: str) -> bool:
     """Validate URL format and length."""
     if not url or len(url) > MAX_URL_LENGTH:
@@ -47,6 +173,7 @@ async def fetch_metadata(url: str, retries: int = MAX_RETRIES) -> ArticleMetadat
 
     Extracts title, author, and domain from the page.
     Includes URL validation, specific error handling, and retry logic.
+    Successful fetches are cached for METADATA_CACHE_TTL.
 
     Args:
         url: The URL to fetch metadata from
@@ -55,42 +182,51 @@ async def fetch_metadata(url: str, retries: int = MAX_RETRIES) -> ArticleMetadat
     Returns:
         ArticleMetadata with extracted information, or partial data on failure
     """
+    cached = get_cached_metadata(url)
+    if cached is not None:
+        return cached
+
+    metadata, fetched = await download_metadata(url, retries)
+    if fetched:
+        cache_metadata(url, metadata)
+    return metadata
+
+
+async def download_metadata(url: str, retries: int = MAX_RETRIES) -> tuple[ArticleMetadata, bool]:
+    """
+    Download and parse a page's metadata, bypassing the cache.
+
+    Returns the metadata and whether the fetch succeeded; on failure the
+    metadata only has the domain, and callers shouldn't cache it.
+    """
     # Extract domain early - we'll need it even if fetch fails
     try:
         parsed = urlparse(url)
-        domain = parsed.netloc.replace("www.", "") or "unknown"
+        domain = parsed.netloc.removeprefix("www.") or "unknown"
     except Exception:
         domain = "unknown"
 
-    # Validate URL format
+    # Validate URL format (including the http/https scheme) before any client is opened
     if not is_valid_url(url):
         logger.warning(f"Invalid URL format: {url[:100]}...")
-        return ArticleMetadata(title=None, author=None, domain=domain)
+        return ArticleMetadata(title=None, author=None, domain=domain), False
 
+    slot = _host_slot(parsed.netloc.lower())
     last_exception = None
     for attempt in range(retries):
         try:
-            async with httpx.AsyncClient(
-                follow_redirects=True,
-                timeout=httpx.Timeout(10.0, connect=5.0)
-            ) as client:
-                response = await client.get(url, headers={
-                    "User-Agent": "Mozilla/5.0 (compatible; Flashback Bot/1.0)"
-                })
+            async with slot, _get_client().stream("GET", url) as response:
                 response.raise_for_status()
-
-            soup = BeautifulSoup(response.text, "html.parser")
-            title = _extract_title(soup)
-            author = _extract_author(soup)
+                title, author = await _read_metadata(response)
 
             logger.debug(f"Successfully fetched metadata from {domain}: title='{title}', author='{author}'")
-            return ArticleMetadata(title=title, author=author, domain=domain)
+            return ArticleMetadata(title=title, author=author, domain=domain), True
 
         except httpx.TimeoutException as e:
             last_exception = e
             logger.warning(f"Timeout fetching {url} (attempt {attempt + 1}/{retries})")
             if attempt < retries - 1:
-                await asyncio.sleep(INITIAL_BACKOFF * (2 ** attempt))
+                await asyncio.sleep(_backoff(attempt))
             continue
 
         except httpx.ConnectError as e:
@@ -103,18 +239,25 @@ async def fetch_metadata(url: str, retries: int = MAX_RETRIES) -> ArticleMetadat
             last_exception = e
             status_code = e.response.status_code
             logger.warning(f"HTTP {status_code} error for {url}")
-            # Don't retry client errors (4xx), only server errors (5xx)
+            if status_code == 429:
+                # Rate limited: wait as long as the host asks, within reason
+                delay = _retry_after(e.response, attempt)
+                if delay is None or attempt == retries - 1:
+                    break
+                await asyncio.sleep(delay)
+                continue
+            # Don't retry other client errors (4xx), only server errors (5xx)
             if 400 <= status_code < 500:
                 break
             if attempt < retries - 1:
-                await asyncio.sleep(INITIAL_BACKOFF * (2 ** attempt))
+                await asyncio.sleep(_backoff(attempt))
             continue
 
         except httpx.RequestError as e:
             last_exception = e
             logger.warning(f"Request error for {url}: {e}")
             if attempt < retries - 1:
-                await asyncio.sleep(INITIAL_BACKOFF * (2 ** attempt))
+                await asyncio.sleep(_backoff(attempt))
             continue
 
         except Exception as e:
@@ -123,7 +266,130 @@ async def fetch_metadata(url: str, retries: int = MAX_RETRIES) -> ArticleMetadat
             break
 
     logger.info(f"Failed to fetch metadata from {url} after {retries} attempts: {last_exception}")
-    return ArticleMetadata(title=None, author=None, domain=domain)
+    return ArticleMetadata(title=None, author=None, domain=domain), False
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff before retry number attempt + 1, plus random jitter."""
+    return INITIAL_BACKOFF * (2 ** attempt) + random.uniform(0, BACKOFF_JITTER)
+
+
+def _retry_after(response: httpx.Response, attempt: int) -> float | None:
+    """Seconds to wait before retrying a 429, or None if the host asks for too long."""
+    value = response.headers.get("Retry-After", "").strip()
+    if value.isdigit():
+        delay = float(value)
+    else:
+        try:
+            delay = (parsedate_to_datetime(value) - datetime.now(UTC)).total_seconds()
+        except (TypeError, ValueError):
+            return _backoff(attempt)  # Missing or malformed; back off as for a 5xx
+    if delay > MAX_RETRY_AFTER:
+        return None
+    return max(delay, 0.0)
+
+
+def _host_slot(host: str) -> asyncio.Semaphore:
+    """Get the semaphore limiting concurrent requests to a host."""
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(HOST_CONCURRENCY)
+    return slot
+
+
+async def _read_metadata(response: httpx.Response) -> tuple[str | None, str | None]:
+    """Read just enough of a streamed page to extract its title and author."""
+    chunks = response.aiter_bytes(READ_CHUNK_SIZE)
+    page = bytearray()
+
+    more = await _read_prefix(chunks, page, MAX_HEAD_BYTES, HEAD_END)
+    encoding = response.charset_encoding
+    scanned = _scan_head(page, encoding)
+    if scanned is not None:
+        return scanned
+
+    soup = _parse_page(page, encoding)
+    title = _extract_title(soup)
+    author = _extract_author(soup)
+
+    # No author in <head>; read a little further for a byline in the body
+    if author is None and more:
+        await _read_prefix(chunks, page, MAX_PAGE_BYTES)
+        author = _extract_author(_parse_page(page, encoding))
+
+    return title, author
+
+
+def _scan_head(page: bytearray, encoding: str | None) -> tuple[str | None, str] | None:
+    """
+    Read the title and author from <head> with regexes, skipping the soup.
+
+    Returns None when the soup is needed: the head is incomplete or doesn't
+    decode cleanly, or no <meta> tag names the author (bylines are in the body).
+    """
+    end = page.lower().find(HEAD_END)
+    if end == -1:
+        return None
+    raw = bytes(page[:end])
+    encoding = encoding or EncodingDetector.find_declared_encoding(raw, is_html=True) or "utf-8"
+    try:
+        head = HEAD_NOISE.sub("", raw.decode(encoding))
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+    metas = [_tag_attrs(match.group(1)) for match in HEAD_META.finditer(head)]
+
+    def first_meta(attr: str, value: str) -> dict | None:
+        return next((meta for meta in metas if meta.get(attr) == value), None)
+
+    # Same order and rules as _extract_author and _extract_title
+    author = None
+    for attr, value in AUTHOR_META:
+        meta = first_meta(attr, value)
+        if meta and meta.get("content"):
+            author = meta["content"].strip()
+            break
+    if author is None:
+        return None
+
+    og_title = first_meta("property", "og:title")
+    if og_title and og_title.get("content"):
+        return og_title["content"].strip(), author
+    title = HEAD_TITLE.search(head)
+    if title and title.group(1):
+        return html.unescape(title.group(1)).strip(), author
+    return None, author
+
+
+def _tag_attrs(text: str) -> dict[str, str]:
+    """Parse the attributes inside a start tag into a dict (the first of a repeated name wins)."""
+    attrs = {}
+    for name, double, single, bare in TAG_ATTR.findall(text):
+        attrs.setdefault(name.lower(), html.unescape(double or single or bare))
+    return attrs
+
+
+def _parse_page(page: bytearray, encoding: str | None) -> BeautifulSoup:
+    """Parse the elements metadata is read from, skipping the rest of the page."""
+    # lxml is a C parser; hand it the raw bytes. A charset from the
+    # Content-Type header wins, otherwise the encoding is sniffed from the page
+    return BeautifulSoup(bytes(page), "lxml", from_encoding=encoding, parse_only=_METADATA_ONLY)
+
+
+async def _read_prefix(chunks, buffer: bytearray, limit: int, marker: bytes | None = None) -> bool:
+    """
+    Append chunks to buffer until marker has been read or limit bytes are buffered.
+
+    Returns True if it stopped early (the body may have more), False once the body is exhausted.
+    """
+    async for chunk in chunks:
+        search_from = max(0, len(buffer) - len(marker)) if marker else 0
+        buffer += chunk
+        if marker and marker in buffer[search_from:].lower():
+            return True
+        if len(buffer) >= limit:
+            return True
+    return False
 
 
 def _extract_title(soup: BeautifulSoup) -> str | None:
@@ -144,28 +410,17 @@ def _extract_title(soup: BeautifulSoup) -> str | None:
 def _extract_author(soup: BeautifulSoup) -> str | None:
     """Extract author information from HTML soup."""
     # Try various meta tags
-    author_selectors = [
-        ("meta", {"name": "author"}),
-        ("meta", {"property": "article:author"}),
-        ("meta", {"property": "og:article:author"}),
-        ("meta", {"name": "twitter:creator"}),
-    ]
-
-    for tag, attrs in author_selectors:
-        element = soup.find(tag, attrs)
+    for attr, value in AUTHOR_META:
+        element = soup.find("meta", {attr: value})
         if element and element.get("content"):
             return element["content"].strip()
 
     # Try common author elements
-    author_classes = ["author", "byline", "author-name", "post-author"]
-    for cls in author_classes:
+    for cls in AUTHOR_CLASSES:
         element = soup.find(class_=cls)
-        if element and element.get_text(strip=True):
-            text = element.get_text(strip=True)
+        text = element.get_text(strip=True) if element else ""
+        if text:
             # Clean up common prefixes
-            for prefix in ["By ", "by ", "Written by ", "Author: "]:
-                if text.startswith(prefix):
-                    text = text[len(prefix):]
-            return text
+            return BYLINE_PREFIX.sub("", text, count=1).strip()
 
     return None
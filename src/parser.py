@@ -1,6 +1,15 @@
+"""
+Parse incoming messages into a quote, source URL and tags.
+
+Don't JIT this module (e.g. with @numba.jit): the work is regex and str
+operations, which Numba only runs in object mode, so the import and compile
+cost would buy nothing.
+"""
+
 import logging
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -9,17 +18,30 @@ MAX_QUOTE_LENGTH = 4000  # Telegram message limit is 4096, leave room for format
 MAX_URL_LENGTH = 2048
 MAX_TAG_LENGTH = 50
 MAX_TAGS = 20
+# Retried and forwarded updates often repeat the same text
+PARSE_CACHE_SIZE = 2048
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ParsedMessage:
     quote: str
     url: str | None
-    tags: list[str]
+    tags: tuple[str, ...]
 
 
-URL_PATTERN = re.compile(r'https?://\S+')
-TAG_PATTERN = re.compile(r'#(\w+)')
+# URLs and #tags in one alternation, so a message is scanned once
+# (a '#' inside a URL stays part of the URL). These stay on the stdlib re
+# engine: the patterns are simple and precompiled, and re2's ASCII-only \w
+# would stop matching tags like #café or #日本. A hand-written str.find
+# scanner is no faster either; the per-character tag loop makes it slower
+TOKEN_PATTERN = re.compile(r'(?P<url>https?://\S+)|#(?P<tag>\w+)')
+TAG_NAME_PATTERN = re.compile(r'\w+')
+# Characters a quote may be wrapped in (as a matching pair)
+QUOTE_CHARS = frozenset('"\'')
+
+# Bound once here; parse_message runs on every incoming update
+_token_finditer = TOKEN_PATTERN.finditer
+_tag_name_fullmatch = TAG_NAME_PATTERN.fullmatch
 
 
 class ValidationError(Exception):
@@ -55,7 +77,7 @@ def validate_tag(tag: str) -> str | None:
         return None
 
     # Only allow alphanumeric and underscore
-    if not re.match(r'^\w+$', tag):
+    if not _tag_name_fullmatch(tag):
         return None
 
     return tag
@@ -72,10 +94,10 @@ def parse_message(text: str) -> ParsedMessage:
 
     Examples:
         "Be the change you wish to see"
-        → quote="Be the change you wish to see", url=None, tags=[]
+        → quote="Be the change you wish to see", url=None, tags=()
 
         "Be the change" https://example.com #wisdom
-        → quote="Be the change", url="https://example.com", tags=["wisdom"]
+        → quote="Be the change", url="https://example.com", tags=("wisdom",)
 
     Args:
         text: The message text to parse
@@ -85,24 +107,34 @@ def parse_message(text: str) -> ParsedMessage:
     """
     # Handle empty or None input
     if not text:
-        return ParsedMessage(quote="", url=None, tags=[])
+        return ParsedMessage(quote="", url=None, tags=())
 
     # Limit input length to prevent abuse
     if len(text) > MAX_QUOTE_LENGTH * 2:  # Allow extra for URL and tags
         logger.warning(f"Input text too long ({len(text)} chars), truncating")
         text = text[:MAX_QUOTE_LENGTH * 2]
 
-    # Extract URL
-    url_match = URL_PATTERN.search(text)
+    # ParsedMessage is immutable, so one result can be shared by every repeat
+    return _parse(text)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(text: str) -> ParsedMessage:
+    """Parse text that parse_message has already checked and length-limited."""
+    if "#" in text or "http" in text:
+        quote, raw_url, raw_tags = _split_tokens(text)
+    else:
+        # Most messages are plain text; without a '#' or 'http' there's nothing to scan for
+        quote, raw_url, raw_tags = text, None, []
+
+    # Validate the URL
     url = None
-    if url_match:
-        raw_url = url_match.group(0)
+    if raw_url:
         url = validate_url(raw_url)
-        if url is None and raw_url:
+        if url is None:
             logger.debug(f"Invalid URL format: {raw_url[:50]}...")
 
-    # Extract and validate tags
-    raw_tags = TAG_PATTERN.findall(text)
+    # Validate tags
     tags = []
     for raw_tag in raw_tags[:MAX_TAGS]:  # Limit number of tags
         validated_tag = validate_tag(raw_tag)
@@ -112,27 +144,41 @@ def parse_message(text: str) -> ParsedMessage:
     if len(raw_tags) > MAX_TAGS:
         logger.warning(f"Too many tags ({len(raw_tags)}), using first {MAX_TAGS}")
 
-    # Remove URL and tags from text to get the quote
-    quote = text
-    if url_match:
-        quote = quote.replace(url_match.group(0), "")
-    for tag in raw_tags:  # Remove all raw tags, even invalid ones
-        quote = quote.replace(f"#{tag}", "")
-
     # Clean up the quote
     quote = quote.strip()
 
-    # Remove surrounding quotes if present
-    if (quote.startswith('"') and quote.endswith('"')) or \
-       (quote.startswith("'") and quote.endswith("'")):
+    # Remove surrounding quotes if present (only the outer pair; a lone quote leaves nothing)
+    if quote and quote[0] in QUOTE_CHARS and (len(quote) == 1 or quote[-1] == quote[0]):
         quote = quote[1:-1].strip()
 
-    # Remove multiple spaces
-    quote = re.sub(r'\s+', ' ', quote)
+    # Collapse runs of whitespace (str.split needs no regex)
+    quote = ' '.join(quote.split())
 
     # Enforce quote length limit
     if len(quote) > MAX_QUOTE_LENGTH:
         logger.warning(f"Quote too long ({len(quote)} chars), truncating")
         quote = quote[:MAX_QUOTE_LENGTH]
 
-    return ParsedMessage(quote=quote, url=url, tags=tags)
+    return ParsedMessage(quote=quote, url=url, tags=tuple(tags))
+
+
+def _split_tokens(text: str) -> tuple[str, str | None, list[str]]:
+    """Split out the first URL and all raw tags in a single pass, keeping the text between them."""
+    raw_url = None
+    raw_tags = []
+    parts = []
+    pos = 0
+    for match in _token_finditer(text):
+        # lastgroup names the alternative that matched
+        if match.lastgroup == "url":
+            token_url = match.group("url")
+            if raw_url is None:
+                raw_url = token_url
+            elif token_url != raw_url:
+                continue  # Only the first URL is the source; keep others in the quote
+        else:
+            raw_tags.append(match.group("tag"))  # Remove all raw tags, even invalid ones
+        parts.append(text[pos:match.start()])
+        pos = match.end()
+    parts.append(text[pos:])
+    return "".join(parts), raw_url, raw_tags
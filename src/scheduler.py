@@ -1,31 +1,45 @@
+import asyncio
 import logging
+from functools import lru_cache
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
 from telegram import Bot
 
 from config import (
-    DAILY_QUOTE_ENABLED,
-    DIGEST_COUNT,
-    DIGEST_ENABLED,
     get_daily_quote_schedule,
     get_digest_schedule,
+    get_settings,
 )
-from src.bot import format_quote
 from src.database import (
     get_quote_count,
     get_random_quotes,
     get_users_for_daily_quote,
     get_users_for_digest,
+    optimize_db,
 )
+from src.formatting import MAX_MESSAGE_LENGTH, format_quote, message_length, truncate
 
 logger = logging.getLogger(__name__)
 
+# How often to refresh the query planner statistics (in minutes)
+OPTIMIZE_INTERVAL = 15
+
 scheduler = AsyncIOScheduler()
 
+# Telegram allows about 30 messages per second across all chats; scheduled
+# sends run concurrently up to that rate
+SENDS_PER_SECOND = 30
+SEND_INTERVAL = 1.0  # seconds each send holds its slot
+
+DIGEST_HEADER = "Your Weekly Quote Digest\n\n"
+# Marks that the digest ran out of room before the last quote
+DIGEST_TRUNCATED = "...\n\n"
+
 
 async def send_digest_to_user(bot: Bot, user_id: int):
     """Send the weekly digest to a specific user."""
-    quotes = await get_random_quotes(user_id, DIGEST_COUNT)
+    quotes = await get_random_quotes(user_id, get_settings().digest_count)
     total = await get_quote_count(user_id)
 
     if not quotes:
@@ -35,18 +49,32 @@ async def send_digest_to_user(bot: Bot, user_id: int):
         )
         return
 
-    message = "Your Weekly Quote Digest\n\n"
+    await bot.send_message(chat_id=user_id, text=_build_digest(quotes, total))
 
-    for i, quote in enumerate(quotes, 1):
-        message += f"{i}. {format_quote(quote)}\n\n"
 
-    message += f"Total saved: {total} quotes"
+def _build_digest(quotes: list, total: int) -> str:
+    """Format digest entries until the message is full, always keeping the footer."""
+    footer = f"Total saved: {total} quotes"
+    parts = [DIGEST_HEADER]
+    # Whatever is left once the header, footer and truncation marker fit
+    budget = MAX_MESSAGE_LENGTH - len(DIGEST_HEADER) - len(footer) - len(DIGEST_TRUNCATED)
 
-    # Telegram has a 4096 character limit
-    if len(message) > 4000:
-        message = message[:3997] + "..."
+    # Lazily formatted, so quotes past the budget are never formatted at all
+    entries = (f"{i}. {format_quote(quote)}\n\n" for i, quote in enumerate(quotes, 1))
+    for entry in entries:
+        entry_length = message_length(entry)
+        if entry_length > budget:
+            if len(parts) == 1:
+                # Always show at least part of the first quote
+                parts.append(truncate(entry, budget) + "\n\n")
+            else:
+                parts.append(DIGEST_TRUNCATED)
+            break
+        parts.append(entry)
+        budget -= entry_length
 
-    await bot.send_message(chat_id=user_id, text=message)
+    parts.append(footer)
+    return "".join(parts)
 
 
 async def send_daily_quote_to_user(bot: Bot, user_id: int):
@@ -66,56 +94,83 @@ async def send_digest_to_all(bot: Bot):
     """Send the weekly digest to all users who have it enabled."""
     users = await get_users_for_digest()
     logger.info(f"Sending weekly digest to {len(users)} users")
-
-    for user in users:
-        try:
-            await send_digest_to_user(bot, user["chat_id"])
-        except Exception as e:
-            logger.error(f"Failed to send digest to user {user['chat_id']}: {e}")
+    await _send_to_users(bot, users, send_digest_to_user, "digest")
 
 
 async def send_daily_quote_to_all(bot: Bot):
     """Send the daily quote to all users who have it enabled."""
     users = await get_users_for_daily_quote()
     logger.info(f"Sending daily quote to {len(users)} users")
+    await _send_to_users(bot, users, send_daily_quote_to_user, "daily quote")
+
+
+async def _send_to_users(bot: Bot, users: list, send, label: str):
+    """Run send(bot, chat_id) for every user concurrently, starting at most SENDS_PER_SECOND per second."""
+    slots = asyncio.Semaphore(SENDS_PER_SECOND)
+
+    async def send_one(chat_id: int):
+        async with slots:
+            try:
+                # Holding the slot for SEND_INTERVAL is what caps the rate
+                await asyncio.gather(send(bot, chat_id), asyncio.sleep(SEND_INTERVAL))
+            except Exception as e:
+                logger.error(f"Failed to send {label} to user {chat_id}: {e}")
+
+    await asyncio.gather(*(send_one(user["chat_id"]) for user in users))
+
+
+@lru_cache(maxsize=1)
+def get_digest_trigger() -> CronTrigger:
+    """Build the weekly digest trigger from settings on first use."""
+    schedule = get_digest_schedule()
+    return CronTrigger(
+        day_of_week=schedule["day_of_week"],
+        hour=schedule["hour"],
+        minute=schedule["minute"],
+        timezone=scheduler.timezone,
+    )
+
 
-    for user in users:
-        try:
-            await send_daily_quote_to_user(bot, user["chat_id"])
-        except Exception as e:
-            logger.error(f"Failed to send daily quote to user {user['chat_id']}: {e}")
+@lru_cache(maxsize=1)
+def get_daily_quote_trigger() -> CronTrigger:
+    """Build the daily quote trigger from settings on first use."""
+    schedule = get_daily_quote_schedule()
+    return CronTrigger(hour=schedule["hour"], minute=schedule["minute"], timezone=scheduler.timezone)
 
 
 def setup_scheduler(bot: Bot):
     """Set up the scheduled jobs."""
+    settings = get_settings()
 
     # Weekly digest
-    if DIGEST_ENABLED:
-        schedule = get_digest_schedule()
+    if settings.digest_enabled:
         scheduler.add_job(
             send_digest_to_all,
-            trigger="cron",
-            day_of_week=schedule["day_of_week"],
-            hour=schedule["hour"],
-            minute=schedule["minute"],
+            trigger=get_digest_trigger(),
             args=[bot],
             id="weekly_digest",
             replace_existing=True,
         )
-        logger.info(f"Weekly digest scheduled for day {schedule['day_of_week']} at {schedule['hour']}:{schedule['minute']}")
+        logger.info(f"Weekly digest scheduled: {get_digest_trigger()}")
 
     # Daily quote of the day
-    if DAILY_QUOTE_ENABLED:
-        daily_schedule = get_daily_quote_schedule()
+    if settings.daily_quote_enabled:
         scheduler.add_job(
             send_daily_quote_to_all,
-            trigger="cron",
-            hour=daily_schedule["hour"],
-            minute=daily_schedule["minute"],
+            trigger=get_daily_quote_trigger(),
             args=[bot],
             id="daily_quote",
             replace_existing=True,
         )
-        logger.info(f"Daily quote scheduled at {daily_schedule['hour']}:{daily_schedule['minute']}")
+        logger.info(f"Daily quote scheduled: {get_daily_quote_trigger()}")
+
+    # Keep query planner statistics fresh
+    scheduler.add_job(
+        optimize_db,
+        trigger="interval",
+        minutes=OPTIMIZE_INTERVAL,
+        id="optimize_db",
+        replace_existing=True,
+    )
 
     scheduler.start()
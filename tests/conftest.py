@@ -1,6 +1,10 @@
 """Shared pytest fixtures for Flashback Bot tests."""
 
+import asyncio
+import os
+import shutil
 import sys
+import tempfile
 from pathlib import Path
 
 import pytest
@@ -14,11 +18,51 @@ _original_db_path = None
 _original_data_dir = None
 
 
+# RAM-backed filesystem, where available, so test databases never touch the disk
+RAM_DIR = Path("/dev/shm")
+
+
+@pytest.fixture(scope="session")
+def db_dir(tmp_path_factory):
+    """Directory for test database files, in RAM when the platform has /dev/shm."""
+    if not (RAM_DIR.is_dir() and os.access(RAM_DIR, os.W_OK)):
+        yield tmp_path_factory.mktemp("db")
+        return
+
+    path = Path(tempfile.mkdtemp(prefix="flashback-tests-", dir=RAM_DIR))
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def template_db(db_dir):
+    """Build the schema once per session; every test_db starts from a copy of it."""
+    from src import database
+
+    template_dir = Path(tempfile.mkdtemp(prefix="template-", dir=db_dir))
+    template_path = template_dir / "test_quotes.db"
+
+    async def build():
+        await database.init_db()
+        await database.close_db()
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, "DATABASE_PATH", template_path)
+        mp.setattr(database, "DATA_DIR", template_dir)
+        asyncio.run(build())
+
+    return template_path
+
+
 @pytest_asyncio.fixture
-async def test_db(tmp_path, monkeypatch):
+async def test_db(db_dir, monkeypatch, template_db):
     """Create and initialize an isolated test database."""
-    test_db_path = tmp_path / "test_quotes.db"
-    test_data_dir = tmp_path
+    test_data_dir = Path(tempfile.mkdtemp(dir=db_dir))
+    test_db_path = test_data_dir / "test_quotes.db"
+
+    # Copying the prebuilt schema is cheaper than creating it, and each test
+    # still gets a file of its own (shared state would leak across event loops)
+    shutil.copyfile(template_db, test_db_path)
 
     # Import modules
     import config
@@ -35,6 +79,28 @@ async def test_db(tmp_path, monkeypatch):
 
     yield test_db_path
 
+    await database.close_db()
+
+
+@pytest.fixture
+def bulk_save_quotes(test_db):
+    """Save many quotes for a user in one transaction, instead of one save_quote call each."""
+    from src import database
+
+    async def save(user_id: int, texts: list[str]) -> int:
+        return await database.save_quotes_bulk(user_id, [{"text": text} for text in texts])
+
+    return save
+
+
+@pytest_asyncio.fixture
+async def test_db_conn(test_db):
+    """Open one raw connection to the test database, for inspecting it directly."""
+    import aiosqlite
+
+    async with aiosqlite.connect(test_db) as db:
+        yield db
+
 
 @pytest.fixture
 def sample_quotes():
@@ -1,8 +1,31 @@
 """Tests for the bot module."""
 
+import asyncio
 from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from src.bot import format_quote, format_relative_time
+import pytest
+
+from src import database, metadata
+from src.bot import (
+    DUPLICATE_WINDOW,
+    MAX_CONCURRENT_UPDATES,
+    ChatOrderedUpdateProcessor,
+    get_metadata,
+    get_pending_url,
+    handle_message,
+    set_pending_url,
+)
+from src.database import DatabaseError
+from src.formatting import (
+    MAX_MESSAGE_LENGTH,
+    format_quote,
+    format_quote_list,
+    format_relative_time,
+    message_length,
+    truncate,
+)
+from src.metadata import ArticleMetadata
 
 
 class TestFormatRelativeTime:
@@ -179,3 +202,217 @@ class TestFormatQuote:
         assert "#wisdom" in result
         assert "📅 Saved" in result
         assert "5h ago" in result
+
+    def test_cached_format_reflects_changed_fields(self):
+        """Test that memoized output changes when a displayed field changes."""
+        quote = {"id": 7, "text": "Same text", "is_favorite": 0}
+        before = format_quote(quote)
+        after = format_quote({**quote, "is_favorite": 1})
+
+        assert "⭐" not in before
+        assert "⭐" in after
+
+    def test_cached_format_keeps_timestamp_fresh(self):
+        """Test that the relative timestamp is not served from the cache."""
+        quote = {"id": 8, "text": "Timed", "created_at": datetime.now().isoformat()}
+        assert "just now" in format_quote(quote)
+
+        older = {**quote, "created_at": (datetime.now() - timedelta(days=3)).isoformat()}
+        assert "3d ago" in format_quote(older)
+
+
+class TestFormatQuoteList:
+    """Test cases for the format_quote_list function."""
+
+    def test_header_quotes_and_footer(self):
+        """Test that quotes are joined between header and footer."""
+        quotes = [{"id": 1, "text": "First"}, {"id": 2, "text": "Second"}]
+        result = format_quote_list("Header:\n\n", quotes, "Footer")
+
+        assert result.startswith("Header:\n\n[#1]")
+        assert "[#2]" in result
+        assert result.endswith("Footer")
+
+    def test_stops_before_length_limit(self):
+        """Test that whole quotes past the limit are left out."""
+        quotes = [{"id": i, "text": "x" * 1000} for i in range(10)]
+        result = format_quote_list("Header\n\n", quotes)
+
+        assert len(result) <= MAX_MESSAGE_LENGTH
+        assert "[#2]" in result
+        assert "[#9]" not in result
+
+    def test_truncates_single_oversized_quote(self):
+        """Test that an oversized first quote is truncated rather than dropped."""
+        quotes = [{"id": 1, "text": "x" * 5000}]
+        result = format_quote_list("Header\n\n", quotes)
+
+        assert len(result) <= MAX_MESSAGE_LENGTH
+        assert "[#1]" in result
+
+
+    def test_truncate_keeps_surrogate_pairs_whole(self):
+        """Test that truncation counts UTF-16 units and never leaves half an emoji."""
+        result = truncate("🙂" * 10, 8)
+
+        assert result == "🙂🙂..."
+        assert message_length(result) <= 8
+
+class TestHandleMessage:
+    """Test cases for the handle_message handler."""
+
+    @staticmethod
+    def _make_update(text):
+        update = MagicMock()
+        update.effective_chat.id = 123
+        update.message.text = text
+        update.message.reply_text = AsyncMock()
+        context = MagicMock()
+        context.user_data = {}
+        return update, context
+
+    @pytest.mark.asyncio
+    async def test_duplicate_is_reported(self):
+        """Test that a quote rejected as a duplicate isn't reported as saved."""
+        update, context = self._make_update("Seen before")
+        with patch("src.bot.register_user", AsyncMock()), \
+                patch("src.bot.save_quote", AsyncMock(return_value=None)) as save:
+            await handle_message(update, context)
+
+        assert save.await_args.kwargs["dedupe_minutes"] == DUPLICATE_WINDOW
+        update.message.reply_text.assert_awaited_once_with("This quote was already saved recently.")
+
+    @pytest.mark.asyncio
+    async def test_duplicate_keeps_pending_url(self):
+        """Test that re-sending a saved quote doesn't use up the link set for the next one."""
+        update, context = self._make_update("Seen before")
+        set_pending_url(context, "https://example.com/next", {"title": "Next", "author": None, "domain": "example.com"})
+        with patch("src.bot.register_user", AsyncMock()), \
+                patch("src.bot.save_quote", AsyncMock(return_value=None)):
+            await handle_message(update, context)
+
+        assert get_pending_url(context)[0] == "https://example.com/next"
+
+    @pytest.mark.asyncio
+    async def test_saved_quote_uses_up_pending_url(self):
+        """Test that a newly saved quote clears the pending link it was saved with."""
+        update, context = self._make_update("Brand new")
+        set_pending_url(context, "https://example.com/a", {"title": "A", "author": None, "domain": "example.com"})
+        with patch("src.bot.register_user", AsyncMock()), \
+                patch("src.bot.save_quote", AsyncMock(return_value=7)) as save:
+            await handle_message(update, context)
+
+        assert save.await_args.kwargs["url"] == "https://example.com/a"
+        assert get_pending_url(context) is None
+
+    @pytest.mark.asyncio
+    async def test_saved_quote_is_confirmed(self):
+        """Test that a new quote gets a confirmation with its id."""
+        update, context = self._make_update("Brand new #fresh")
+        with patch("src.bot.register_user", AsyncMock()), \
+                patch("src.bot.save_quote", AsyncMock(return_value=7)):
+            await handle_message(update, context)
+
+        reply = update.message.reply_text.await_args.args[0]
+        assert reply.startswith('Saved (#7): "Brand new"')
+        assert "#fresh" in reply
+
+    @pytest.mark.asyncio
+    async def test_quote_after_url_waits_for_its_metadata(self):
+        """Test that a quote sent right after a slow URL still picks up that URL."""
+        url_update, context = self._make_update("https://example.com/article")
+        quote_update, _ = self._make_update("The quote from it")
+        other_chat, other_context = self._make_update("Unrelated chat")
+        other_chat.effective_chat.id = 456
+
+        async def slow_metadata(url):
+            await asyncio.sleep(0.05)
+            return ArticleMetadata(title="Article", author=None, domain="example.com")
+
+        processor = ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES)
+        with patch("src.bot.register_user", AsyncMock()), \
+                patch("src.bot.get_metadata", slow_metadata), \
+                patch("src.bot.save_quote", AsyncMock(return_value=1)) as save:
+            await asyncio.gather(
+                processor.process_update(url_update, handle_message(url_update, context)),
+                processor.process_update(quote_update, handle_message(quote_update, context)),
+                processor.process_update(other_chat, handle_message(other_chat, other_context)),
+            )
+
+        saved = {call.kwargs["text"]: call.kwargs for call in save.await_args_list}
+        assert saved["The quote from it"]["url"] == "https://example.com/article"
+        assert saved["The quote from it"]["title"] == "Article"
+        # Other chats aren't held up behind the slow fetch
+        assert save.await_args_list[0].kwargs["text"] == "Unrelated chat"
+
+
+    @pytest.mark.asyncio
+    async def test_burst_from_one_chat_does_not_block_others(self):
+        """Test that updates queued behind their own chat don't use up the concurrency limit."""
+        processor = ChatOrderedUpdateProcessor(2)
+        busy, _ = self._make_update("busy")
+        other, _ = self._make_update("other")
+        other.effective_chat.id = 456
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        burst = [asyncio.create_task(processor.process_update(busy, slow())) for _ in range(4)]
+        await asyncio.sleep(0)
+        try:
+            # Times out if the busy chat's queued updates hold every slot
+            await asyncio.wait_for(processor.process_update(other, asyncio.sleep(0)), 1)
+        finally:
+            release.set()
+            await asyncio.gather(*burst)
+
+class TestGetMetadata:
+    """Test cases for the layered metadata lookup."""
+
+    @pytest.mark.asyncio
+    async def test_fetched_metadata_survives_restart(self, test_db):
+        """Test that fetched metadata is reused from the database once memory is cleared."""
+        url = "https://example.com/article"
+        fetched = ArticleMetadata(title="Title", author=None, domain="example.com")
+
+        try:
+            with patch("src.bot.download_metadata", AsyncMock(return_value=(fetched, True))):
+                await get_metadata(url)
+            metadata._metadata_cache.clear()
+
+            with patch("src.bot.download_metadata", AsyncMock()) as download:
+                result = await get_metadata(url + "#comments")
+        finally:
+            metadata._metadata_cache.clear()
+
+        download.assert_not_awaited()
+        assert result == fetched
+
+    @pytest.mark.asyncio
+    async def test_failed_fetch_is_not_stored(self, test_db):
+        """Test that partial metadata from a failed fetch isn't cached anywhere."""
+        url = "https://example.com/down"
+        partial = ArticleMetadata(title=None, author=None, domain="example.com")
+
+        with patch("src.bot.download_metadata", AsyncMock(return_value=(partial, False))):
+            assert await get_metadata(url) == partial
+
+        assert metadata.get_cached_metadata(url) is None
+        assert await database.get_stored_metadata(url, timedelta(days=1)) is None
+
+    @pytest.mark.asyncio
+    async def test_database_failure_does_not_block_lookup(self):
+        """Test that an unavailable metadata store falls back to the network."""
+        fetched = ArticleMetadata(title="Title", author=None, domain="example.com")
+        failure = AsyncMock(side_effect=DatabaseError("disk I/O error"))
+
+        try:
+            with patch("src.bot.get_stored_metadata", failure), \
+                    patch("src.bot.store_metadata", failure), \
+                    patch("src.bot.download_metadata", AsyncMock(return_value=(fetched, True))):
+                result = await get_metadata("https://example.com/a")
+        finally:
+            metadata._metadata_cache.clear()
+
+        assert result == fetched
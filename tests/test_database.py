@@ -1,6 +1,8 @@
 """Tests for the database module."""
 
+import asyncio
 import json
+from datetime import timedelta
 
 import pytest
 
@@ -11,27 +13,23 @@ class TestDatabaseInit:
     """Test cases for database initialization."""
 
     @pytest.mark.asyncio
-    async def test_init_creates_tables(self, test_db):
+    async def test_init_creates_tables(self, test_db_conn):
         """Test that init_db creates required tables."""
-        import aiosqlite
-
-        async with aiosqlite.connect(test_db) as db:
-            cursor = await db.execute(
-                "SELECT name FROM sqlite_master WHERE type='table'"
-            )
-            tables = {row[0] for row in await cursor.fetchall()}
+        cursor = await test_db_conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+        )
+        tables = {row[0] for row in await cursor.fetchall()}
 
         assert "users" in tables
         assert "quotes" in tables
+        assert "tags" in tables
+        assert "quote_tags" in tables
 
     @pytest.mark.asyncio
-    async def test_init_creates_users_columns(self, test_db):
+    async def test_init_creates_users_columns(self, test_db_conn):
         """Test that users table has required columns."""
-        import aiosqlite
-
-        async with aiosqlite.connect(test_db) as db:
-            cursor = await db.execute("PRAGMA table_info(users)")
-            columns = {row[1] for row in await cursor.fetchall()}
+        cursor = await test_db_conn.execute("PRAGMA table_info(users)")
+        columns = {row[1] for row in await cursor.fetchall()}
 
         assert "chat_id" in columns
         assert "username" in columns
@@ -40,18 +38,94 @@ class TestDatabaseInit:
         assert "daily_quote_enabled" in columns
 
     @pytest.mark.asyncio
-    async def test_init_creates_quotes_columns(self, test_db):
+    async def test_init_creates_quotes_columns(self, test_db_conn):
         """Test that quotes table has required columns."""
-        import aiosqlite
-
-        async with aiosqlite.connect(test_db) as db:
-            cursor = await db.execute("PRAGMA table_info(quotes)")
-            columns = {row[1] for row in await cursor.fetchall()}
+        cursor = await test_db_conn.execute("PRAGMA table_info(quotes)")
+        columns = {row[1] for row in await cursor.fetchall()}
 
         expected = {"id", "user_id", "text", "url", "source_title", "source_author",
                     "source_domain", "tags", "is_favorite", "times_shown", "last_shown", "created_at"}
         assert expected.issubset(columns)
 
+    @pytest.mark.asyncio
+    async def test_init_enables_wal(self, test_db):
+        """Test that the shared connection switches the database to WAL mode."""
+        db = await database._get_connection()
+        cursor = await db.execute("PRAGMA journal_mode")
+        row = await cursor.fetchone()
+
+        assert row[0] == "wal"
+
+    @pytest.mark.asyncio
+    async def test_init_sets_busy_timeout(self, test_db):
+        """Test that writers wait for locks instead of failing immediately."""
+        db = await database._get_connection()
+        cursor = await db.execute("PRAGMA busy_timeout")
+        row = await cursor.fetchone()
+
+        assert row[0] == 5000
+
+    @pytest.mark.asyncio
+    async def test_init_rebuilds_legacy_quotes_table(self, tmp_path, monkeypatch):
+        """Test that a pre-multi-user quotes table is rebuilt with NOT NULL user_id, keeping rows."""
+        import aiosqlite
+
+        db_path = tmp_path / "legacy.db"
+        monkeypatch.setattr(database, "DATABASE_PATH", db_path)
+        monkeypatch.setattr(database, "DATA_DIR", tmp_path)
+        async with aiosqlite.connect(db_path) as db:
+            await db.executescript("""
+                CREATE TABLE quotes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    text TEXT NOT NULL,
+                    url TEXT,
+                    tags TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                INSERT INTO quotes (text, tags) VALUES ('Single user days', 'history');
+                ALTER TABLE quotes ADD COLUMN user_id INTEGER DEFAULT 0;
+            """)
+
+        try:
+            await database.init_db()
+
+            db = await database._get_connection()
+            cursor = await db.execute("PRAGMA table_info(quotes)")
+            columns = {row["name"]: row for row in await cursor.fetchall()}
+            assert columns["user_id"]["notnull"] == 1
+            assert "text_hash" in columns
+
+            assert await database.get_quote_count(0) == 1
+            assert len(await database.search_quotes(0, "single")) == 1
+            assert len(await database.get_quotes_by_tag(0, "history")) == 1
+
+            # New saves keep counting up from the copied ids
+            await database.register_user(123, "user", "User")
+            assert await database.save_quote(user_id=123, text="New era") == 2
+        finally:
+            await database.close_db()
+
+    @pytest.mark.asyncio
+    async def test_recent_quotes_use_user_created_index(self, test_db):
+        """Test that per-user recency lists walk an index instead of sorting."""
+        db = await database._get_connection()
+        cursor = await db.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM quotes WHERE user_id = ? ORDER BY created_at DESC LIMIT 5",
+            (123,)
+        )
+        plan = " ".join(row[3] for row in await cursor.fetchall())
+
+        assert "idx_quotes_user_created" in plan
+        assert "TEMP B-TREE" not in plan
+
+    @pytest.mark.asyncio
+    async def test_queries_reuse_shared_connection(self, test_db):
+        """Test that queries run on the connection opened by init_db."""
+        db = await database._get_connection()
+        await database.register_user(123, "user", "User")
+
+        assert await database._get_connection() is db
+
 
 class TestUserFunctions:
     """Test cases for user-related database functions."""
@@ -193,11 +267,77 @@ class TestQuoteFunctions:
         assert count == 3
 
     @pytest.mark.asyncio
-    async def test_get_last_quotes(self, test_db):
+    async def test_quote_count_refreshes_after_writes(self, test_db):
+        """Test that cached counts are invalidated by saves and deletes."""
+        await database.register_user(123, "user", "User")
+        assert await database.get_quote_count(123) == 0
+
+        quote_id = await database.save_quote(user_id=123, text="Quote 1")
+        assert await database.get_quote_count(123) == 1
+
+        await database.delete_quote(123, quote_id)
+        assert await database.get_quote_count(123) == 0
+
+    @pytest.mark.asyncio
+    async def test_quote_count_is_cached(self, test_db):
+        """Test that counts are served from memory until a write or the TTL."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Quote 1")
+        assert await database.get_quote_count(123) == 1
+
+        # Bypass save_quote so the cache isn't invalidated
+        db = await database._get_connection()
+        await db.execute("INSERT INTO quotes (user_id, text) VALUES (123, 'Sneaky')")
+        await db.commit()
+
+        assert await database.get_quote_count(123) == 1
+
+    @pytest.mark.asyncio
+    async def test_quote_count_counter_tracks_writes(self, test_db):
+        """Test that users.quote_count is kept up to date by every kind of write."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="First")
+        quote_id = await database.save_quote(user_id=123, text="After")
+        await database.save_quotes_bulk(123, [{"text": "Bulk 1"}, {"text": "Bulk 2"}])
+        await database.delete_quote(123, quote_id)
+
+        db = await database._get_connection()
+        cursor = await db.execute("SELECT quote_count FROM users WHERE chat_id = 123")
+        assert (await cursor.fetchone())[0] == 3
+        assert await database.get_quote_count(123) == 3
+
+    @pytest.mark.asyncio
+    async def test_save_quotes_bulk(self, test_db):
+        """Test saving a batch of quotes, with their tags, in one call."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Existing", tags=["old"])
+
+        saved = await database.save_quotes_bulk(123, [
+            {"text": "First", "tags": ["wisdom", "old"]},
+            {"text": "Second", "url": "https://example.com", "domain": "example.com"},
+            {"text": "Third", "tags": ["wisdom"]},
+        ])
+
+        assert saved == 3
+        assert await database.get_quote_count(123) == 4
+        assert {q["text"] for q in await database.get_quotes_by_tag(123, "wisdom")} == {"First", "Third"}
+        assert await database.get_top_tags(123) == [("old", 2), ("wisdom", 2)]
+
+    @pytest.mark.asyncio
+    async def test_save_quotes_bulk_is_all_or_nothing(self, test_db):
+        """Test that an invalid quote rejects the whole batch."""
+        await database.register_user(123, "user", "User")
+
+        with pytest.raises(ValueError):
+            await database.save_quotes_bulk(123, [{"text": "Fine"}, {"text": "  "}])
+
+        assert await database.get_quote_count(123) == 0
+
+    @pytest.mark.asyncio
+    async def test_get_last_quotes(self, test_db, bulk_save_quotes):
         """Test getting most recent quotes."""
         await database.register_user(123, "user", "User")
-        for i in range(10):
-            await database.save_quote(user_id=123, text=f"Quote {i}")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(10)])
 
         quotes = await database.get_last_quotes(123, n=5)
 
@@ -206,6 +346,19 @@ class TestQuoteFunctions:
         quote_texts = {q["text"] for q in quotes}
         assert len(quote_texts) == 5
 
+    @pytest.mark.asyncio
+    async def test_rows_support_key_index_and_get(self, test_db):
+        """Test that returned rows work like the dicts callers used to get."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Row quote", url="https://example.com")
+
+        (quote,) = await database.get_last_quotes(123, n=1)
+
+        assert quote["text"] == quote.get("text") == "Row quote"
+        assert quote.get("missing") is None
+        assert quote.get("missing", "fallback") == "fallback"
+        assert dict(quote)["url"] == "https://example.com"
+
     @pytest.mark.asyncio
     async def test_search_quotes(self, test_db):
         """Test searching quotes by keyword."""
@@ -228,6 +381,103 @@ class TestQuoteFunctions:
 
         assert len(results) == 1
 
+    @pytest.mark.asyncio
+    async def test_search_quotes_matches_word_prefix(self, test_db):
+        """Test that search matches the beginning of words."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Philosophy of mind")
+
+        results = await database.search_quotes(123, "philo")
+
+        assert len(results) == 1
+
+    @pytest.mark.asyncio
+    async def test_search_quotes_handles_fts_syntax(self, test_db):
+        """Test that FTS operators in the keyword are treated as plain text."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text='Say "hello" AND goodbye')
+
+        results = await database.search_quotes(123, '"hello" AND')
+
+        assert len(results) == 1
+
+    @pytest.mark.asyncio
+    async def test_search_quotes_after_delete(self, test_db):
+        """Test that deleted quotes disappear from the search index."""
+        await database.register_user(123, "user", "User")
+        quote_id = await database.save_quote(user_id=123, text="Ephemeral words")
+        await database.delete_quote(123, quote_id)
+
+        results = await database.search_quotes(123, "ephemeral")
+
+        assert results == []
+
+    @pytest.mark.asyncio
+    async def test_search_quotes_ignores_accents(self, test_db):
+        """Test that search folds diacritics on both sides."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Un café au lait")
+
+        assert len(await database.search_quotes(123, "cafe")) == 1
+        assert len(await database.search_quotes(123, "CAFÉ")) == 1
+
+    @pytest.mark.asyncio
+    async def test_get_quotes_by_source_domain(self, test_db):
+        """Test finding quotes by a word of their source domain."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="From the blog", domain="blog.example.com")
+        await database.save_quote(user_id=123, text="From elsewhere", domain="other.org")
+
+        results = await database.get_quotes_by_source(123, "example")
+
+        assert [q["text"] for q in results] == ["From the blog"]
+
+    @pytest.mark.asyncio
+    async def test_get_quotes_by_source_title(self, test_db):
+        """Test finding quotes by their source title."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Titled", title="Meditations", domain="books.com")
+
+        results = await database.get_quotes_by_source(123, "medit")
+
+        assert len(results) == 1
+
+    @pytest.mark.asyncio
+    async def test_init_upgrades_old_search_index(self, test_db):
+        """Test that a text/tags-only FTS index is rebuilt with the source fields."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Old row", domain="legacy.net")
+        db = await database._get_connection()
+        await db.executescript("""
+            DROP TRIGGER quotes_fts_insert;
+            DROP TRIGGER quotes_fts_delete;
+            DROP TRIGGER quotes_fts_update;
+            DROP TABLE quotes_fts;
+            CREATE VIRTUAL TABLE quotes_fts USING fts5(
+                text, tags, content='quotes', content_rowid='id'
+            );
+        """)
+
+        await database.init_db()
+
+        assert len(await database.get_quotes_by_source(123, "legacy")) == 1
+        assert len(await database.search_quotes(123, "old")) == 1
+
+
+    @pytest.mark.asyncio
+    async def test_get_quotes_this_week_boundary(self, test_db, test_db_conn):
+        """Test that the 7-day window is measured against the UTC timestamps SQLite stores."""
+        await database.register_user(123, "user", "User")
+        await database.save_quotes_bulk(123, [{"text": "Inside"}, {"text": "Outside"}])
+        await test_db_conn.execute(
+            "UPDATE quotes SET created_at = datetime('now', '-7 days', '+1 hour') WHERE text = 'Inside'"
+        )
+        await test_db_conn.execute(
+            "UPDATE quotes SET created_at = datetime('now', '-7 days', '-1 hour') WHERE text = 'Outside'"
+        )
+        await test_db_conn.commit()
+
+        assert await database.get_quotes_this_week(123) == 1
 
 class TestTagFunctions:
     """Test cases for tag-related functionality."""
@@ -244,6 +494,17 @@ class TestTagFunctions:
 
         assert len(results) == 2
 
+    @pytest.mark.asyncio
+    async def test_get_quotes_by_tag_exact_match(self, test_db):
+        """Test that a tag does not match longer tags containing it."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Quote 1", tags=["golang"])
+        await database.save_quote(user_id=123, text="Quote 2", tags=["go"])
+
+        results = await database.get_quotes_by_tag(123, "go")
+
+        assert [q["text"] for q in results] == ["Quote 2"]
+
     @pytest.mark.asyncio
     async def test_get_top_tags(self, test_db):
         """Test getting most used tags."""
@@ -259,6 +520,48 @@ class TestTagFunctions:
         assert top_tags[0][0] == "common"
         assert top_tags[0][1] == 3
 
+    @pytest.mark.asyncio
+    async def test_migration_links_legacy_csv_tags(self, test_db):
+        """Test that init_db backfills quote_tags from the legacy tags column."""
+        import aiosqlite
+
+        await database.register_user(123, "user", "User")
+        await database.close_db()
+        async with aiosqlite.connect(test_db) as db:
+            await db.execute(
+                "INSERT INTO quotes (user_id, text, tags) VALUES (123, 'Legacy', 'old, older,,old')"
+            )
+            await db.commit()
+
+        await database.init_db()
+
+        assert len(await database.get_quotes_by_tag(123, "older")) == 1
+        assert await database.get_top_tags(123) == [("old", 1), ("older", 1)]
+        # text_hash was backfilled, so the legacy row still counts for dedupe
+        assert await database.save_quote(user_id=123, text="Legacy", dedupe_minutes=60) is None
+
+    @pytest.mark.asyncio
+    async def test_get_top_tags_per_user(self, test_db):
+        """Test that tag counts only include the user's own quotes."""
+        await database.register_user(123, "user1", "User1")
+        await database.register_user(456, "user2", "User2")
+        await database.save_quote(user_id=123, text="Q1", tags=["shared"])
+        await database.save_quote(user_id=456, text="Q2", tags=["shared"])
+
+        top_tags = await database.get_top_tags(123)
+
+        assert top_tags == [("shared", 1)]
+
+    @pytest.mark.asyncio
+    async def test_delete_quote_unlinks_tags(self, test_db):
+        """Test that deleting a quote removes it from tag counts."""
+        await database.register_user(123, "user", "User")
+        quote_id = await database.save_quote(user_id=123, text="Q1", tags=["gone"])
+        await database.delete_quote(123, quote_id)
+
+        assert await database.get_top_tags(123) == []
+        assert await database.get_quotes_by_tag(123, "gone") == []
+
 
 class TestFavoriteFunctions:
     """Test cases for favorite functionality."""
@@ -308,45 +611,16 @@ class TestFavoriteFunctions:
 
         assert len(favorites) == 2
 
-
-class TestDuplicateDetection:
-    """Test cases for duplicate detection."""
-
-    @pytest.mark.asyncio
-    async def test_is_duplicate_true(self, test_db):
-        """Test detecting a duplicate quote within time window."""
-        await database.register_user(123, "user", "User")
-        await database.save_quote(user_id=123, text="Duplicate me")
-
-        # Note: Due to timestamp format differences between SQLite CURRENT_TIMESTAMP
-        # (space-separated) and Python isoformat (T-separated), duplicate detection
-        # may not work as expected in tests. This tests the function returns boolean.
-        # In production, this works because quotes saved recently will have comparable timestamps.
-        result = await database.is_duplicate(123, "Duplicate me", minutes=60)
-
-        # The function should return a boolean
-        assert isinstance(result, bool)
-
     @pytest.mark.asyncio
-    async def test_is_duplicate_false_different_text(self, test_db):
-        """Test that different text is not duplicate."""
+    async def test_get_favorite_count(self, test_db):
+        """Test counting favorites without fetching them."""
         await database.register_user(123, "user", "User")
-        await database.save_quote(user_id=123, text="Original text")
+        for i in range(3):
+            quote_id = await database.save_quote(user_id=123, text=f"Quote {i}")
+            await database.toggle_favorite(123, quote_id)
 
-        result = await database.is_duplicate(123, "Different text", minutes=1)
-
-        assert result is False
-
-    @pytest.mark.asyncio
-    async def test_is_duplicate_false_different_user(self, test_db):
-        """Test that same text from different user is not duplicate."""
-        await database.register_user(123, "user1", "User1")
-        await database.register_user(456, "user2", "User2")
-        await database.save_quote(user_id=123, text="Same text")
-
-        result = await database.is_duplicate(456, "Same text", minutes=1)
-
-        assert result is False
+        assert await database.get_favorite_count(123) == 3
+        assert len(await database.get_favorite_quotes(123, limit=2)) == 2
 
 
 class TestExport:
@@ -360,12 +634,13 @@ class TestExport:
         await database.save_quote(user_id=123, text="Quote 2")
 
         exported = await database.export_all_quotes(123)
-        data = json.loads(exported)
+        data = json.loads(exported.getvalue())
 
         assert len(data) == 2
         # Verify both quotes are exported (order may vary)
         texts = {q["text"] for q in data}
         assert texts == {"Quote 1", "Quote 2"}
+        assert "text_hash" not in data[0]
 
     @pytest.mark.asyncio
     async def test_export_empty(self, test_db):
@@ -373,20 +648,66 @@ class TestExport:
         await database.register_user(123, "user", "User")
 
         exported = await database.export_all_quotes(123)
-        data = json.loads(exported)
+        data = json.loads(exported.getvalue())
 
         assert data == []
 
+    @pytest.mark.asyncio
+    async def test_export_more_rows_than_batch(self, test_db, bulk_save_quotes, monkeypatch):
+        """Test that rows spanning several fetch batches are all exported."""
+        monkeypatch.setattr(database, "EXPORT_BATCH_SIZE", 2)
+        await database.register_user(123, "user", "User")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(5)])
+
+        await database.save_quote(user_id=123, text="Older")
+        await database.save_quote(user_id=123, text="Newest")
+        db = await database._get_connection()
+        await db.execute("UPDATE quotes SET created_at = datetime('now', '-1 day') WHERE text = 'Older'")
+        await db.execute("UPDATE quotes SET created_at = datetime('now', '+1 day') WHERE text = 'Newest'")
+        await db.commit()
+
+        exported = await database.export_all_quotes(123)
+        data = json.loads(exported.getvalue())
+
+        # Quotes sharing a created_at aren't skipped or repeated across batches
+        assert len({q["id"] for q in data}) == len(data) == 7
+        assert (data[0]["text"], data[-1]["text"]) == ("Newest", "Older")
+
+    @pytest.mark.asyncio
+    async def test_iter_quote_export_yields_valid_json(self, test_db, bulk_save_quotes):
+        """Test that the chunks join into the same document as export_all_quotes."""
+        await database.register_user(123, "user", "User")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(3)])
+
+        chunks = [chunk async for chunk in database.iter_quote_export(123)]
+
+        assert len(chunks) == 5  # "[", three rows, "]"
+        assert json.loads(b"".join(chunks)) == json.loads(
+            (await database.export_all_quotes(123)).getvalue()
+        )
+
+
+    @pytest.mark.asyncio
+    async def test_abandoned_export_does_not_block_close(self, test_db, bulk_save_quotes, monkeypatch):
+        """Test that a consumer stopping mid-export leaves no pooled connection checked out."""
+        monkeypatch.setattr(database, "EXPORT_BATCH_SIZE", 2)
+        await database.register_user(123, "user", "User")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(5)])
+
+        export = database.iter_quote_export(123)
+        await anext(export)
+        await anext(export)  # Stopped inside the first batch, never closed
+
+        await asyncio.wait_for(database.close_db(), 1)
 
 class TestRandomQuotes:
     """Test cases for random quote selection."""
 
     @pytest.mark.asyncio
-    async def test_get_random_quotes(self, test_db):
+    async def test_get_random_quotes(self, test_db, bulk_save_quotes):
         """Test getting random quotes."""
         await database.register_user(123, "user", "User")
-        for i in range(20):
-            await database.save_quote(user_id=123, text=f"Quote {i}")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(20)])
 
         quotes = await database.get_random_quotes(123, n=5)
 
@@ -413,3 +734,220 @@ class TestRandomQuotes:
         quotes = await database.get_random_quotes(123, n=10)
 
         assert len(quotes) == 1
+
+    @pytest.mark.asyncio
+    async def test_get_random_quotes_prefers_unshown(self, test_db, bulk_save_quotes):
+        """Test that spaced repetition serves never-shown quotes first."""
+        await database.register_user(123, "user", "User")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(3)])
+
+        seen = set()
+        for _ in range(3):
+            quotes = await database.get_random_quotes(123, n=1)
+            seen.add(quotes[0]["id"])
+
+        assert len(seen) == 3
+
+    @pytest.mark.asyncio
+    async def test_get_random_quotes_returns_priority_order(self, test_db, bulk_save_quotes):
+        """Test that quotes come back in spaced-repetition order, not id order."""
+        await database.register_user(123, "user", "User")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(6)])
+        db = await database._get_connection()
+        await db.execute("UPDATE quotes SET last_shown = datetime('now'), times_shown = 1 WHERE id IN (1, 2)")
+        await db.execute("UPDATE quotes SET last_shown = datetime('now', '-40 days'), times_shown = 1 WHERE id IN (3, 4)")
+        await db.commit()
+
+        quotes = await database.get_random_quotes(123, n=6)
+
+        order = [q["id"] for q in quotes]
+        assert set(order[:2]) == {5, 6}
+        assert set(order[2:4]) == {3, 4}
+        assert set(order[4:]) == {1, 2}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_random_quotes_never_overlap(self, test_db, bulk_save_quotes):
+        """Test that concurrent callers are never handed the same unshown quote."""
+        await database.register_user(123, "user", "User")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(6)])
+
+        batches = await asyncio.gather(
+            *(database.get_random_quotes(123, n=2) for _ in range(3))
+        )
+
+        ids = [q["id"] for batch in batches for q in batch]
+        assert len(ids) == len(set(ids)) == 6
+        assert all(q["times_shown"] == 1 for batch in batches for q in batch)
+
+    @pytest.mark.asyncio
+    async def test_get_random_quotes_without_spaced_repetition(self, test_db, bulk_save_quotes):
+        """Test the plain random selection path."""
+        await database.register_user(123, "user", "User")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(5)])
+
+        quotes = await database.get_random_quotes(123, n=3, use_spaced_repetition=False)
+
+        assert len(quotes) == 3
+        assert all(q["times_shown"] == 1 for q in quotes)
+
+    @pytest.mark.asyncio
+    async def test_get_random_quotes_without_spaced_repetition_caps_at_count(self, test_db, bulk_save_quotes):
+        """Test that plain random selection returns each quote at most once."""
+        await database.register_user(123, "user", "User")
+        await database.register_user(456, "other", "Other")
+        await bulk_save_quotes(123, [f"Quote {i}" for i in range(3)])
+        await database.save_quote(user_id=456, text="Not yours")
+
+        quotes = await database.get_random_quotes(123, n=10, use_spaced_repetition=False)
+
+        assert sorted(q["text"] for q in quotes) == ["Quote 0", "Quote 1", "Quote 2"]
+
+
+class TestConnectionLifecycle:
+    """Test cases for the shared connection's lifecycle."""
+
+    @pytest.mark.asyncio
+    async def test_close_waits_for_in_flight_write(self, test_db):
+        """Test that closing the database lets a running transaction commit first."""
+        await database.register_user(123, "user", "User")
+        started = asyncio.Event()
+
+        async def slow_write():
+            async with database._transaction() as db:
+                started.set()
+                await asyncio.sleep(0.05)
+                await db.execute(
+                    "INSERT INTO quotes (user_id, text) VALUES (123, 'Committed on shutdown')"
+                )
+
+        write = asyncio.create_task(slow_write())
+        await started.wait()
+        await database.close_db()
+        await write
+
+        await database.init_db()
+        assert await database.get_quote_count(123) == 1
+
+    @pytest.mark.asyncio
+    async def test_read_pool_is_read_only(self, test_db):
+        """Test that pooled read connections reject writes."""
+        import aiosqlite
+
+        async with database._read_connection() as db:
+            with pytest.raises(aiosqlite.OperationalError):
+                await db.execute("INSERT INTO users (chat_id) VALUES (1)")
+
+    @pytest.mark.asyncio
+    async def test_reads_see_committed_writes(self, test_db):
+        """Test that pooled readers see what the writer just committed."""
+        await database.register_user(123, "user", "User")
+        quote_id = await database.save_quote(user_id=123, text="Fresh quote")
+
+        quote = await database.get_quote_by_id(123, quote_id)
+
+        assert quote["text"] == "Fresh quote"
+
+    @pytest.mark.asyncio
+    async def test_queries_after_close_raise(self, test_db):
+        """Test that queries fail cleanly once the connection is closed."""
+        await database.close_db()
+
+        with pytest.raises(database.DatabaseError):
+            await database.get_quote_count(123)
+
+
+class TestSaveQuoteDedupe:
+    """Test cases for save_quote's built-in duplicate check."""
+
+    @pytest.mark.asyncio
+    async def test_dedupe_skips_recent_duplicate(self, test_db):
+        """Test that a repeat within the window is not saved."""
+        await database.register_user(123, "user", "User")
+        first = await database.save_quote(user_id=123, text="Once only", dedupe_minutes=1)
+        second = await database.save_quote(user_id=123, text="  Once only ", dedupe_minutes=1)
+
+        assert first is not None
+        assert second is None
+        assert await database.get_quote_count(123) == 1
+
+    @pytest.mark.asyncio
+    async def test_dedupe_is_per_user(self, test_db):
+        """Test that other users' quotes don't count as duplicates."""
+        await database.register_user(123, "user", "User")
+        await database.register_user(456, "other", "Other")
+        await database.save_quote(user_id=123, text="Shared words", dedupe_minutes=1)
+
+        assert await database.save_quote(user_id=456, text="Shared words", dedupe_minutes=1) is not None
+
+    @pytest.mark.asyncio
+    async def test_concurrent_duplicates_save_once(self, test_db):
+        """Test that two copies arriving together are saved only once."""
+        await database.register_user(123, "user", "User")
+
+        results = await asyncio.gather(
+            database.save_quote(user_id=123, text="Double tap", dedupe_minutes=1),
+            database.save_quote(user_id=123, text="Double tap", dedupe_minutes=1),
+        )
+
+        assert sorted(results, key=lambda r: r is None)[1] is None
+        assert await database.get_quote_count(123) == 1
+
+    @pytest.mark.asyncio
+    async def test_dedupe_allows_repeat_outside_window(self, test_db, test_db_conn):
+        """Test that quotes older than the window aren't duplicates."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Old news")
+        await test_db_conn.execute("UPDATE quotes SET created_at = datetime('now', '-2 hours')")
+        await test_db_conn.commit()
+
+        assert await database.save_quote(user_id=123, text="Old news", dedupe_minutes=60) is not None
+
+    @pytest.mark.asyncio
+    async def test_dedupe_allows_different_text(self, test_db):
+        """Test that only identical text counts as a duplicate."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Original text", dedupe_minutes=1)
+
+        assert await database.save_quote(user_id=123, text="Different text", dedupe_minutes=1) is not None
+
+    @pytest.mark.asyncio
+    async def test_no_dedupe_by_default(self, test_db):
+        """Test that save_quote always inserts without dedupe_minutes."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Again")
+
+        assert await database.save_quote(user_id=123, text="Again") is not None
+
+
+class TestMetadataStore:
+    """Test cases for the persistent URL metadata cache."""
+
+    @pytest.mark.asyncio
+    async def test_store_and_get_metadata(self, test_db):
+        """Test that stored metadata is returned within max_age."""
+        await database.store_metadata("https://example.com/a", "Title", "Author", "example.com")
+
+        stored = await database.get_stored_metadata("https://example.com/a", timedelta(hours=1))
+
+        assert dict(stored) == {"title": "Title", "author": "Author", "domain": "example.com"}
+
+    @pytest.mark.asyncio
+    async def test_store_metadata_refreshes(self, test_db):
+        """Test that storing a URL again replaces its metadata."""
+        await database.store_metadata("https://example.com/a", "Old", None, "example.com")
+        await database.store_metadata("https://example.com/a", "New", None, "example.com")
+
+        stored = await database.get_stored_metadata("https://example.com/a", timedelta(hours=1))
+
+        assert stored["title"] == "New"
+
+    @pytest.mark.asyncio
+    async def test_stale_metadata_is_ignored(self, test_db):
+        """Test that entries older than max_age are treated as missing."""
+        await database.store_metadata("https://example.com/a", "Title", None, "example.com")
+        db = await database._get_connection()
+        await db.execute("UPDATE metadata_cache SET fetched_at = datetime('now', '-2 days')")
+        await db.commit()
+
+        assert await database.get_stored_metadata("https://example.com/a", timedelta(days=1)) is None
+
@@ -1,274 +1,521 @@
 """Tests for the metadata extraction module."""
 
-from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+from unittest.mock import AsyncMock, patch
 
+import httpx
 import pytest
+import pytest_asyncio
 from bs4 import BeautifulSoup
 
+from src import metadata
 from src.metadata import (
+    MAX_PAGE_BYTES,
     ArticleMetadata,
     _extract_author,
     _extract_title,
+    cache_metadata,
     fetch_metadata,
+    get_cached_metadata,
+    normalize_url,
 )
 
 
-class TestExtractTitle:
-    """Test cases for the _extract_title helper function."""
+@pytest_asyncio.fixture(autouse=True)
+async def fresh_client():
+    """Give every test its own shared HTTP client (each test has its own event loop) and an empty cache."""
+    await metadata.close_client()
+    metadata._metadata_cache.clear()
+    yield
+    await metadata.close_client()
+    metadata._metadata_cache.clear()
 
-    def test_extracts_og_title(self):
-        """Test extraction of og:title meta tag."""
-        html = '<html><head><meta property="og:title" content="OG Title" /></head></html>'
-        soup = BeautifulSoup(html, "html.parser")
 
-        assert _extract_title(soup) == "OG Title"
+@pytest.fixture(scope="module")
+def parse():
+    """Parse HTML the way fetch_metadata does: lxml, metadata elements only."""
+    def _parse(html: str) -> BeautifulSoup:
+        return metadata._parse_page(bytearray(html.encode()), None)
 
-    def test_falls_back_to_title_tag(self):
-        """Test fallback to <title> tag when og:title is missing."""
-        html = "<html><head><title>Page Title</title></head></html>"
-        soup = BeautifulSoup(html, "html.parser")
+    return _parse
 
-        assert _extract_title(soup) == "Page Title"
 
-    def test_prefers_og_title_over_title_tag(self):
-        """Test that og:title takes precedence over <title>."""
-        html = '''
-        <html><head>
-            <title>Title Tag</title>
-            <meta property="og:title" content="OG Title" />
-        </head></html>
-        '''
-        soup = BeautifulSoup(html, "html.parser")
+class TestExtractTitle:
+    """Test cases for the _extract_title helper function."""
 
-        assert _extract_title(soup) == "OG Title"
+    @pytest.mark.parametrize("html, expected", [
+        pytest.param(
+            '<html><head><meta property="og:title" content="OG Title" /></head></html>',
+            "OG Title", id="og_title",
+        ),
+        pytest.param(
+            "<html><head><title>Page Title</title></head></html>",
+            "Page Title", id="falls_back_to_title_tag",
+        ),
+        pytest.param(
+            '<html><head><title>Title Tag</title><meta property="og:title" content="OG Title" /></head></html>',
+            "OG Title", id="prefers_og_title",
+        ),
+        pytest.param(
+            "<html><head></head><body></body></html>",
+            None, id="no_title",
+        ),
+        pytest.param(
+            '<html><head><meta property="og:title" content="  Spaced Title  " /></head></html>',
+            "Spaced Title", id="strips_whitespace",
+        ),
+        pytest.param(
+            # Empty content should fall through to title tag
+            '<html><head><meta property="og:title" content="" /><title>Fallback</title></head></html>',
+            "Fallback", id="empty_og_title",
+        ),
+    ])
+    def test_extract_title(self, parse, html, expected):
+        """Test og:title, the <title> fallback, and whitespace handling."""
+        assert _extract_title(parse(html)) == expected
 
-    def test_returns_none_when_no_title(self):
-        """Test that None is returned when no title is found."""
-        html = "<html><head></head><body></body></html>"
-        soup = BeautifulSoup(html, "html.parser")
 
-        assert _extract_title(soup) is None
+class TestExtractAuthor:
+    """Test cases for the _extract_author helper function."""
 
-    def test_strips_whitespace_from_title(self):
-        """Test that whitespace is stripped from titles."""
-        html = '<html><head><meta property="og:title" content="  Spaced Title  " /></head></html>'
-        soup = BeautifulSoup(html, "html.parser")
+    @pytest.mark.parametrize("html, expected", [
+        pytest.param(
+            '<html><head><meta name="author" content="John Doe" /></head></html>',
+            "John Doe", id="meta_author",
+        ),
+        pytest.param(
+            '<html><head><meta property="article:author" content="Jane Smith" /></head></html>',
+            "Jane Smith", id="article_author",
+        ),
+        pytest.param(
+            '<html><head><meta name="twitter:creator" content="@johndoe" /></head></html>',
+            "@johndoe", id="twitter_creator",
+        ),
+        pytest.param(
+            '<html><body><span class="author">Bob Wilson</span></body></html>',
+            "Bob Wilson", id="author_class",
+        ),
+        pytest.param(
+            '<html><body><div class="byline">Alice Johnson</div></body></html>',
+            "Alice Johnson", id="byline_class",
+        ),
+        pytest.param(
+            '<html><body><span class="author">By John Doe</span></body></html>',
+            "John Doe", id="strips_by_prefix",
+        ),
+        pytest.param(
+            '<html><body><span class="author">Written by Jane Doe</span></body></html>',
+            "Jane Doe", id="strips_written_by_prefix",
+        ),
+        pytest.param(
+            '<html><body><span class="author">BY John Doe</span></body></html>',
+            "John Doe", id="strips_by_prefix_case_insensitive",
+        ),
+        pytest.param(
+            '<html><body><span class="author">Author: Jane Doe</span></body></html>',
+            "Jane Doe", id="strips_author_label",
+        ),
+        pytest.param(
+            '<html><body><span class="author">Byron Katie</span></body></html>',
+            "Byron Katie", id="keeps_names_starting_with_by",
+        ),
+        pytest.param(
+            "<html><head></head><body><p>No author here</p></body></html>",
+            None, id="no_author",
+        ),
+        pytest.param(
+            '<html><head><meta name="author" content="Meta Author" /></head>'
+            '<body><span class="author">Class Author</span></body></html>',
+            "Meta Author", id="prefers_meta_over_class",
+        ),
+    ])
+    def test_extract_author(self, parse, html, expected):
+        """Test the meta tags, byline classes and prefix cleanup, in order of preference."""
+        assert _extract_author(parse(html)) == expected
+
+
+def mock_http(handler):
+    """Route fetch_metadata's requests to `handler` through an httpx.MockTransport."""
+    real_client = httpx.AsyncClient
+
+    def client(**kwargs):
+        return real_client(transport=httpx.MockTransport(handler), **kwargs)
+
+    return patch("src.metadata.httpx.AsyncClient", side_effect=client)
+
+
+def html_response(html: str | bytes, status_code: int = 200):
+    """Build a handler that always answers with the given HTML."""
+    content = html.encode() if isinstance(html, str) else html
+    return lambda request: httpx.Response(status_code, content=content)
 
-        assert _extract_title(soup) == "Spaced Title"
 
-    def test_handles_empty_og_title(self):
-        """Test handling of empty og:title content."""
-        html = '<html><head><meta property="og:title" content="" /><title>Fallback</title></head></html>'
-        soup = BeautifulSoup(html, "html.parser")
+class TestFetchMetadata:
+    """Test cases for the fetch_metadata function."""
 
-        # Empty content should fall through to title tag
-        assert _extract_title(soup) == "Fallback"
+    @pytest.mark.asyncio
+    async def test_extracts_domain_from_url(self):
+        """Test that domain is correctly extracted from URL."""
+        with mock_http(html_response("<html><head><title>Test</title></head></html>")):
+            result = await fetch_metadata("https://www.example.com/article")
 
+        assert result.domain == "example.com"
 
-class TestExtractAuthor:
-    """Test cases for the _extract_author helper function."""
+    @pytest.mark.asyncio
+    async def test_removes_www_from_domain(self):
+        """Test that 'www.' is stripped from domain."""
+        with mock_http(html_response("<html><head><title>Test</title></head></html>")):
+            result = await fetch_metadata("https://www.test-site.org/page")
 
-    def test_extracts_meta_author(self):
-        """Test extraction from meta name='author' tag."""
-        html = '<html><head><meta name="author" content="John Doe" /></head></html>'
-        soup = BeautifulSoup(html, "html.parser")
+        assert result.domain == "test-site.org"
 
-        assert _extract_author(soup) == "John Doe"
+    @pytest.mark.asyncio
+    async def test_only_leading_www_is_removed(self):
+        """Test that 'www.' elsewhere in the host is kept."""
+        with mock_http(html_response("<html><head><title>Test</title></head></html>")):
+            result = await fetch_metadata("https://awww.example.com/page")
 
-    def test_extracts_article_author(self):
-        """Test extraction from article:author meta tag."""
-        html = '<html><head><meta property="article:author" content="Jane Smith" /></head></html>'
-        soup = BeautifulSoup(html, "html.parser")
+        assert result.domain == "awww.example.com"
 
-        assert _extract_author(soup) == "Jane Smith"
+    @pytest.mark.asyncio
+    async def test_rejects_non_http_scheme(self):
+        """Test that unsupported URLs return bare metadata without creating a client."""
+        with mock_http(html_response("<html></html>")) as client:
+            result = await fetch_metadata("ftp://example.com/file")
 
-    def test_extracts_twitter_creator(self):
-        """Test extraction from twitter:creator meta tag."""
-        html = '<html><head><meta name="twitter:creator" content="@johndoe" /></head></html>'
-        soup = BeautifulSoup(html, "html.parser")
+        assert result == ArticleMetadata(title=None, author=None, domain="example.com")
+        client.assert_not_called()
 
-        assert _extract_author(soup) == "@johndoe"
+    @pytest.mark.asyncio
+    async def test_returns_metadata_on_success(self, mock_html_response):
+        """Test successful metadata extraction."""
+        with mock_http(html_response(mock_html_response)):
+            result = await fetch_metadata("https://example.com/article")
 
-    def test_extracts_from_author_class(self):
-        """Test extraction from element with 'author' class."""
-        html = '<html><body><span class="author">Bob Wilson</span></body></html>'
-        soup = BeautifulSoup(html, "html.parser")
+        assert isinstance(result, ArticleMetadata)
+        assert result.title == "Test Article"
+        assert result.author == "John Doe"
+        assert result.domain == "example.com"
 
-        assert _extract_author(soup) == "Bob Wilson"
+    @pytest.mark.asyncio
+    async def test_handles_network_error(self):
+        """Test that network errors return partial metadata with domain only."""
+        def handler(request):
+            raise httpx.ConnectError("Connection failed", request=request)
 
-    def test_extracts_from_byline_class(self):
-        """Test extraction from element with 'byline' class."""
-        html = '<html><body><div class="byline">Alice Johnson</div></body></html>'
-        soup = BeautifulSoup(html, "html.parser")
+        with mock_http(handler):
+            result = await fetch_metadata("https://example.com/article")
 
-        assert _extract_author(soup) == "Alice Johnson"
+        assert result.domain == "example.com"
+        assert result.title is None
+        assert result.author is None
 
-    def test_strips_by_prefix(self):
-        """Test that 'By ' prefix is stripped from author names."""
-        html = '<html><body><span class="author">By John Doe</span></body></html>'
-        soup = BeautifulSoup(html, "html.parser")
+    @pytest.mark.asyncio
+    async def test_handles_timeout(self):
+        """Test that timeouts return partial metadata with domain only."""
+        def handler(request):
+            raise httpx.TimeoutException("Timeout", request=request)
 
-        assert _extract_author(soup) == "John Doe"
+        with mock_http(handler), patch("src.metadata.asyncio.sleep", AsyncMock()):
+            result = await fetch_metadata("https://slow-site.com/page")
 
-    def test_strips_written_by_prefix(self):
-        """Test that 'Written by ' prefix is stripped."""
-        html = '<html><body><span class="author">Written by Jane Doe</span></body></html>'
-        soup = BeautifulSoup(html, "html.parser")
+        assert result.domain == "slow-site.com"
+        assert result.title is None
+        assert result.author is None
 
-        assert _extract_author(soup) == "Jane Doe"
+    @pytest.mark.asyncio
+    async def test_retries_back_off_with_jitter(self):
+        """Test that retry delays grow exponentially with a bounded random jitter."""
+        def handler(request):
+            return httpx.Response(503, content=b"Busy")
 
-    def test_returns_none_when_no_author(self):
-        """Test that None is returned when no author is found."""
-        html = "<html><head></head><body><p>No author here</p></body></html>"
-        soup = BeautifulSoup(html, "html.parser")
+        sleep = AsyncMock()
+        with mock_http(handler), patch("src.metadata.asyncio.sleep", sleep):
+            await fetch_metadata("https://busy-site.com/page")
 
-        assert _extract_author(soup) is None
+        delays = [call.args[0] for call in sleep.await_args_list]
+        assert len(delays) == metadata.MAX_RETRIES - 1
+        for attempt, delay in enumerate(delays):
+            base = metadata.INITIAL_BACKOFF * 2 ** attempt
+            assert base <= delay <= base + metadata.BACKOFF_JITTER
 
-    def test_prefers_meta_over_class(self):
-        """Test that meta tags take precedence over class-based extraction."""
-        html = '''
-        <html>
-        <head><meta name="author" content="Meta Author" /></head>
-        <body><span class="author">Class Author</span></body>
-        </html>
-        '''
-        soup = BeautifulSoup(html, "html.parser")
+    @pytest.mark.asyncio
+    async def test_handles_http_error(self):
+        """Test that HTTP errors (404, 500) return partial metadata."""
+        requests = []
 
-        assert _extract_author(soup) == "Meta Author"
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(404, content=b"Not found")
 
+        with mock_http(handler):
+            result = await fetch_metadata("https://example.com/not-found")
 
-class TestFetchMetadata:
-    """Test cases for the fetch_metadata function."""
+        assert result.domain == "example.com"
+        assert result.title is None
+        # Client errors aren't retried
+        assert len(requests) == 1
 
     @pytest.mark.asyncio
-    async def test_extracts_domain_from_url(self):
-        """Test that domain is correctly extracted from URL."""
-        with patch("src.metadata.httpx.AsyncClient") as mock_client:
-            mock_response = MagicMock()
-            mock_response.text = "<html><head><title>Test</title></head></html>"
-            mock_response.raise_for_status = MagicMock()
+    async def test_respects_retry_after(self):
+        """Test that a 429 is retried after the delay the host asks for."""
+        responses = [
+            httpx.Response(429, headers={"Retry-After": "2"}),
+            httpx.Response(200, content=b"<html><head><title>Later</title></head></html>"),
+        ]
+        sleep = AsyncMock()
 
-            mock_instance = AsyncMock()
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            mock_instance.__aenter__ = AsyncMock(return_value=mock_instance)
-            mock_instance.__aexit__ = AsyncMock(return_value=None)
-            mock_client.return_value = mock_instance
+        with mock_http(lambda request: responses.pop(0)), patch("src.metadata.asyncio.sleep", sleep):
+            result = await fetch_metadata("https://busy-site.com/page")
 
-            result = await fetch_metadata("https://www.example.com/article")
-
-            assert result.domain == "example.com"
+        assert result.title == "Later"
+        sleep.assert_awaited_once_with(2.0)
 
     @pytest.mark.asyncio
-    async def test_removes_www_from_domain(self):
-        """Test that 'www.' is stripped from domain."""
-        with patch("src.metadata.httpx.AsyncClient") as mock_client:
-            mock_response = MagicMock()
-            mock_response.text = "<html><head><title>Test</title></head></html>"
-            mock_response.raise_for_status = MagicMock()
+    async def test_long_retry_after_is_not_waited_for(self):
+        """Test that a 429 asking for more than MAX_RETRY_AFTER gives up straight away."""
+        requests = []
 
-            mock_instance = AsyncMock()
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            mock_instance.__aenter__ = AsyncMock(return_value=mock_instance)
-            mock_instance.__aexit__ = AsyncMock(return_value=None)
-            mock_client.return_value = mock_instance
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(429, headers={"Retry-After": "3600"})
 
-            result = await fetch_metadata("https://www.test-site.org/page")
+        sleep = AsyncMock()
+        with mock_http(handler), patch("src.metadata.asyncio.sleep", sleep):
+            result = await fetch_metadata("https://busy-site.com/page")
 
-            assert result.domain == "test-site.org"
+        assert result.title is None
+        assert len(requests) == 1
+        sleep.assert_not_awaited()
 
     @pytest.mark.asyncio
-    async def test_returns_metadata_on_success(self, mock_html_response):
-        """Test successful metadata extraction."""
-        with patch("src.metadata.httpx.AsyncClient") as mock_client:
-            mock_response = MagicMock()
-            mock_response.text = mock_html_response
-            mock_response.raise_for_status = MagicMock()
+    async def test_limits_concurrent_requests_per_host(self, monkeypatch):
+        """Test that at most HOST_CONCURRENCY requests run against one host at a time."""
+        monkeypatch.setattr(metadata, "HOST_CONCURRENCY", 2)
+        in_flight = []
+        peak = {"example.com": 0, "other.com": 0}
+
+        async def handler(request):
+            host = request.url.host
+            in_flight.append(host)
+            peak[host] = max(peak[host], in_flight.count(host))
+            await asyncio.sleep(0.01)
+            in_flight.remove(host)
+            return httpx.Response(200, content=b"<html><head><title>T</title></head></html>")
+
+        with mock_http(handler):
+            await asyncio.gather(
+                *(fetch_metadata(f"https://example.com/{i}") for i in range(5)),
+                *(fetch_metadata(f"https://other.com/{i}") for i in range(2)),
+            )
 
-            mock_instance = AsyncMock()
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            mock_instance.__aenter__ = AsyncMock(return_value=mock_instance)
-            mock_instance.__aexit__ = AsyncMock(return_value=None)
-            mock_client.return_value = mock_instance
+        assert peak == {"example.com": 2, "other.com": 2}
 
-            result = await fetch_metadata("https://example.com/article")
+    @pytest.mark.asyncio
+    async def test_returns_article_metadata_dataclass(self):
+        """Test that the function returns an ArticleMetadata instance."""
+        with mock_http(html_response("<html><head><title>Test</title></head></html>")):
+            result = await fetch_metadata("https://example.com")
+
+        assert isinstance(result, ArticleMetadata)
+
+    def test_article_metadata_is_hashable(self):
+        """Test that metadata is immutable, since cached instances are shared."""
+        result = ArticleMetadata(title="T", author=None, domain="example.com")
 
-            assert isinstance(result, ArticleMetadata)
-            assert result.title == "Test Article"
-            assert result.author == "John Doe"
-            assert result.domain == "example.com"
+        assert hash(result) == hash(ArticleMetadata(title="T", author=None, domain="example.com"))
+        with pytest.raises(AttributeError):
+            result.title = "Changed"
 
     @pytest.mark.asyncio
-    async def test_handles_network_error(self):
-        """Test that network errors return partial metadata with domain only."""
-        import httpx
+    async def test_reuses_one_client(self):
+        """Test that fetches share a single pooled client."""
+        with mock_http(html_response("<html><head><title>Test</title></head></html>")) as client:
+            await fetch_metadata("https://example.com/a")
+            await fetch_metadata("https://example.com/b")
 
-        with patch("src.metadata.httpx.AsyncClient") as mock_client:
-            mock_instance = AsyncMock()
-            mock_instance.get = AsyncMock(side_effect=httpx.ConnectError("Connection failed"))
-            mock_instance.__aenter__ = AsyncMock(return_value=mock_instance)
-            mock_instance.__aexit__ = AsyncMock(return_value=None)
-            mock_client.return_value = mock_instance
+        assert client.call_count == 1
 
-            result = await fetch_metadata("https://example.com/article")
+    @pytest.mark.asyncio
+    async def test_stops_reading_after_head(self):
+        """Test that the body isn't downloaded once <head> has what we need."""
+        read = []
+
+        async def body():
+            yield b'<html><head><title>Early</title><meta name="author" content="Ann" /></HEAD><body>'
+            for _ in range(MAX_PAGE_BYTES // 1024):
+                read.append(1024)
+                yield b"x" * 1024
+            yield b"</body></html>"
 
-            assert result.domain == "example.com"
-            assert result.title is None
-            assert result.author is None
+        with mock_http(lambda request: httpx.Response(200, content=body())):
+            result = await fetch_metadata("https://example.com/long")
+
+        assert (result.title, result.author) == ("Early", "Ann")
+        assert sum(read) < MAX_PAGE_BYTES // 4
 
     @pytest.mark.asyncio
-    async def test_handles_timeout(self):
-        """Test that timeouts return partial metadata with domain only."""
-        import httpx
+    async def test_uses_charset_from_content_type(self):
+        """Test that a charset given only in the HTTP header is honoured."""
+        html = "<html><head><title>Привет мир</title></head><body></body></html>"
+
+        def handler(request):
+            return httpx.Response(
+                200,
+                content=html.encode("windows-1251"),
+                headers={"Content-Type": "text/html; charset=windows-1251"},
+            )
 
-        with patch("src.metadata.httpx.AsyncClient") as mock_client:
-            mock_instance = AsyncMock()
-            mock_instance.get = AsyncMock(side_effect=httpx.TimeoutException("Timeout"))
-            mock_instance.__aenter__ = AsyncMock(return_value=mock_instance)
-            mock_instance.__aexit__ = AsyncMock(return_value=None)
-            mock_client.return_value = mock_instance
+        with mock_http(handler):
+            result = await fetch_metadata("https://example.ru/article")
 
-            result = await fetch_metadata("https://slow-site.com/page")
+        assert result.title == "Привет мир"
 
-            assert result.domain == "slow-site.com"
-            assert result.title is None
-            assert result.author is None
+    @pytest.mark.asyncio
+    async def test_reads_into_body_for_byline(self):
+        """Test that a byline near the top of the body is still found."""
+        html = (
+            "<html><head><title>Post</title></head>"
+            '<body><p class="byline">By Jane Roe</p>' + "x" * MAX_PAGE_BYTES + "</body></html>"
+        )
+        with mock_http(html_response(html)):
+            result = await fetch_metadata("https://example.com/post")
+
+        assert result.author == "Jane Roe"
 
     @pytest.mark.asyncio
-    async def test_handles_http_error(self):
-        """Test that HTTP errors (404, 500) return partial metadata."""
-        import httpx
+    async def test_byline_found_among_many_elements(self):
+        """Test that a byline with several classes is found after a large body payload."""
+        html = (
+            "<html><head><title>Post</title></head><body>"
+            + "<div><p>filler</p></div>" * 2000
+            + '<p class="post-meta byline">By Jane Roe</p></body></html>'
+        )
+        with mock_http(html_response(html)):
+            result = await fetch_metadata("https://example.com/post")
+
+        assert (result.title, result.author) == ("Post", "Jane Roe")
+
+    def test_parse_page_skips_unrelated_elements(self):
+        """Test that only title, meta and byline elements are built into the soup."""
+        page = bytearray(
+            b"<html><head><title>T</title><meta name='author' content='A' /></head><body>"
+            + b"<div><p>filler</p></div>" * 2000
+            + b"<p class='author'>Z</p></body></html>"
+        )
+        soup = metadata._parse_page(page, None)
+
+        assert [tag.name for tag in soup.find_all(True)] == ["title", "meta", "p"]
+
+
+class TestScanHead:
+    """Test cases for the regex fast path over <head>."""
+
+    @pytest.mark.parametrize("head", [
+        pytest.param(
+            '<html><head><title>T &amp; U</title><meta name="author" content="Ann &amp; Bo" /></head>',
+            id="entities",
+        ),
+        pytest.param(
+            "<html><head><meta property='og:title' content='OG'><meta name=author content=Ann></head>",
+            id="single_quoted_and_bare_attributes",
+        ),
+        pytest.param(
+            '<html><head><meta property="og:title" content="" /><title> Fallback </title>'
+            '<meta name="twitter:creator" content="@ann" /></head>',
+            id="empty_og_title_falls_back",
+        ),
+        pytest.param(
+            '<html><head><!-- <meta name="author" content="Commented"> -->'
+            '<script>document.write(\'<meta name="author" content="Scripted">\')</script>'
+            '<meta property="article:author" content="Real" /></head>',
+            id="ignores_comments_and_scripts",
+        ),
+        pytest.param(
+            '<html><head><meta name="author" content="" /><meta property="og:article:author" content="Og" />'
+            '<title>T</title></head>',
+            id="skips_empty_author",
+        ),
+    ])
+    def test_agrees_with_soup(self, head):
+        """Test that the fast path reads the same title and author as the soup would."""
+        page = bytearray(head.encode() + b"<body></body></html>")
+        soup = metadata._parse_page(page, None)
+
+        assert metadata._scan_head(page, None) == (_extract_title(soup), _extract_author(soup))
+
+    def test_uses_declared_charset(self):
+        """Test that a <meta charset> declaration decodes the head."""
+        head = '<html><head><meta charset="windows-1251"><title>Привет</title><meta name="author" content="Иван"></head>'
+        assert metadata._scan_head(bytearray(head.encode("windows-1251")), None) == ("Привет", "Иван")
+
+    def test_defers_to_soup_without_meta_author(self):
+        """Test that pages whose author is only in a body byline go through the soup."""
+        page = bytearray(b'<html><head><title>Post</title></head><body><p class="byline">By Ann</p>')
+        assert metadata._scan_head(page, None) is None
 
-        with patch("src.metadata.httpx.AsyncClient") as mock_client:
-            mock_response = MagicMock()
-            mock_response.raise_for_status = MagicMock(
-                side_effect=httpx.HTTPStatusError("404", request=MagicMock(), response=MagicMock())
-            )
+    @pytest.mark.asyncio
+    async def test_fetch_skips_soup_for_meta_author(self, mock_html_response):
+        """Test that a page naming its author in <head> is never parsed into a soup."""
+        with mock_http(html_response(mock_html_response)), \
+                patch("src.metadata._parse_page", side_effect=AssertionError("soup built")):
+            result = await fetch_metadata("https://example.com/article")
 
-            mock_instance = AsyncMock()
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            mock_instance.__aenter__ = AsyncMock(return_value=mock_instance)
-            mock_instance.__aexit__ = AsyncMock(return_value=None)
-            mock_client.return_value = mock_instance
+        assert (result.title, result.author) == ("Test Article", "John Doe")
 
-            result = await fetch_metadata("https://example.com/not-found")
 
-            assert result.domain == "example.com"
-            assert result.title is None
+class TestMetadataCache:
+    """Test cases for the in-memory metadata cache."""
+
+    def test_normalize_url_drops_fragment_and_sorts_query(self):
+        """Test that equivalent URLs share a cache key."""
+        assert normalize_url("https://Example.com/a?b=2&a=1#top") == "https://example.com/a?a=1&b=2"
+
+    def test_normalize_url_drops_tracking_parameters(self):
+        """Test that shares differing only in utm_* parameters share a cache key."""
+        shared = "https://example.com/a?utm_source=tg&id=3&UTM_Medium=social"
+        assert normalize_url(shared) == normalize_url("https://example.com/a?id=3")
 
     @pytest.mark.asyncio
-    async def test_returns_article_metadata_dataclass(self):
-        """Test that the function returns an ArticleMetadata instance."""
-        with patch("src.metadata.httpx.AsyncClient") as mock_client:
-            mock_response = MagicMock()
-            mock_response.text = "<html><head><title>Test</title></head></html>"
-            mock_response.raise_for_status = MagicMock()
+    async def test_repeat_fetch_is_cached(self):
+        """Test that a successful fetch isn't repeated for the same article."""
+        requests = []
 
-            mock_instance = AsyncMock()
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            mock_instance.__aenter__ = AsyncMock(return_value=mock_instance)
-            mock_instance.__aexit__ = AsyncMock(return_value=None)
-            mock_client.return_value = mock_instance
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, content=b"<html><head><title>Once</title></head></html>")
 
-            result = await fetch_metadata("https://example.com")
+        with mock_http(handler):
+            first = await fetch_metadata("https://example.com/a?x=1&y=2")
+            second = await fetch_metadata("https://example.com/a?y=2&x=1#section")
 
-            assert isinstance(result, ArticleMetadata)
+        assert first.title == second.title == "Once"
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_fetch_is_not_cached(self):
+        """Test that failures are retried on the next fetch."""
+        with mock_http(html_response("Gone", status_code=404)):
+            await fetch_metadata("https://example.com/flaky")
+
+        assert get_cached_metadata("https://example.com/flaky") is None
+
+    def test_expired_entries_are_dropped(self, monkeypatch):
+        """Test that entries older than the TTL are not served."""
+        cache_metadata("https://example.com/old", ArticleMetadata("Old", None, "example.com"))
+        monkeypatch.setattr(metadata, "METADATA_CACHE_TTL", -1)
+        cache_metadata("https://example.com/stale", ArticleMetadata("Stale", None, "example.com"))
+
+        assert get_cached_metadata("https://example.com/old").title == "Old"
+        assert get_cached_metadata("https://example.com/stale") is None
+
+    def test_least_recently_used_is_evicted(self, monkeypatch):
+        """Test that the cache stays bounded."""
+        monkeypatch.setattr(metadata, "METADATA_CACHE_SIZE", 2)
+        for name in ("a", "b"):
+            cache_metadata(f"https://example.com/{name}", ArticleMetadata(name, None, "example.com"))
+        get_cached_metadata("https://example.com/a")
+        cache_metadata("https://example.com/c", ArticleMetadata("c", None, "example.com"))
+
+        assert get_cached_metadata("https://example.com/b") is None
+        assert get_cached_metadata("https://example.com/a").title == "a"
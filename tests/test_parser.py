@@ -1,5 +1,10 @@
 """Tests for the message parser module."""
 
+from unittest.mock import patch
+
+import pytest
+
+from src import parser
 from src.parser import ParsedMessage, parse_message
 
 
@@ -12,7 +17,7 @@ class TestParseMessage:
 
         assert result.quote == "Be the change you wish to see"
         assert result.url is None
-        assert result.tags == []
+        assert result.tags == ()
 
     def test_quote_with_url(self):
         """Test parsing a quote with a URL."""
@@ -20,7 +25,7 @@ class TestParseMessage:
 
         assert result.quote == "Great article"
         assert result.url == "https://example.com/article"
-        assert result.tags == []
+        assert result.tags == ()
 
     def test_quote_with_tags(self):
         """Test parsing a quote with hashtags."""
@@ -28,7 +33,7 @@ class TestParseMessage:
 
         assert result.quote == "Life is beautiful"
         assert result.url is None
-        assert result.tags == ["wisdom", "inspiration"]
+        assert result.tags == ("wisdom", "inspiration")
 
     def test_quote_with_url_and_tags(self):
         """Test parsing a quote with both URL and tags."""
@@ -50,13 +55,22 @@ class TestParseMessage:
 
         assert result.quote == "This is a quoted text"
 
+    def test_mismatched_quotes_kept(self):
+        """Test that only a matching pair of quote characters is removed."""
+        assert parse_message('"Half quoted\'').quote == '"Half quoted\''
+
+    def test_lone_quote_character_is_empty(self):
+        """Test that a message of just a quote character leaves no quote to save."""
+        assert parse_message('"').quote == ""
+        assert parse_message("'").quote == ""
+
     def test_url_only(self):
         """Test parsing a message with only a URL."""
         result = parse_message("https://example.com/article")
 
         assert result.quote == ""
         assert result.url == "https://example.com/article"
-        assert result.tags == []
+        assert result.tags == ()
 
     def test_http_url(self):
         """Test that HTTP URLs are also matched."""
@@ -64,12 +78,29 @@ class TestParseMessage:
 
         assert result.url == "http://example.com"
 
+    def test_plain_text_skips_token_scan(self):
+        """Test that messages without '#' or 'http' never reach the regex scan."""
+        parser._parse.cache_clear()
+        with patch("src.parser._split_tokens", wraps=parser._split_tokens) as split:
+            plain = parse_message("  Just   a thought  ")
+            tagged = parse_message("A thought #idea")
+
+        assert plain == ParsedMessage(quote="Just a thought", url=None, tags=())
+        assert tagged.tags == ("idea",)
+        split.assert_called_once_with("A thought #idea")
+
     def test_multiple_spaces_normalized(self):
         """Test that multiple spaces are collapsed to single spaces."""
         result = parse_message("This   has    multiple   spaces")
 
         assert result.quote == "This has multiple spaces"
 
+    def test_tabs_and_newlines_normalized(self):
+        """Test that any run of whitespace, not just spaces, becomes one space."""
+        result = parse_message("Line one\n\n\tline two\u00a0 end")
+
+        assert result.quote == "Line one line two end"
+
     def test_whitespace_trimmed(self):
         """Test that leading/trailing whitespace is removed."""
         result = parse_message("   Whitespace around   ")
@@ -82,7 +113,7 @@ class TestParseMessage:
 
         assert result.quote == "Article"
         assert result.url == "https://example.com/page?id=123&ref=twitter"
-        assert result.tags == ["tech"]
+        assert result.tags == ("tech",)
 
     def test_url_with_fragments(self):
         """Test parsing URLs with fragments."""
@@ -90,6 +121,20 @@ class TestParseMessage:
 
         assert result.url == "https://example.com/page#section-2"
 
+    def test_url_fragment_is_not_a_tag(self):
+        """Test that a '#' inside the URL isn't picked up as a tag."""
+        result = parse_message("Section https://example.com/page#section_2 #real")
+
+        assert result.quote == "Section"
+        assert result.tags == ("real",)
+
+    def test_only_first_url_is_removed(self):
+        """Test that later, different URLs stay in the quote."""
+        result = parse_message("Source https://a.com and see https://b.com")
+
+        assert result.url == "https://a.com"
+        assert result.quote == "Source and see https://b.com"
+
     def test_multiple_tags(self):
         """Test parsing multiple hashtags."""
         result = parse_message("Quote #tag1 #tag2 #tag3 #tag4")
@@ -97,6 +142,13 @@ class TestParseMessage:
         assert len(result.tags) == 4
         assert set(result.tags) == {"tag1", "tag2", "tag3", "tag4"}
 
+    def test_tag_prefix_of_another_tag(self):
+        """Test that removing #ai leaves #aim and the word 'said' intact."""
+        result = parse_message("He said #ai then #aim")
+
+        assert result.quote == "He said then"
+        assert result.tags == ("ai", "aim")
+
     def test_tag_with_numbers(self):
         """Test that tags can contain numbers."""
         result = parse_message("Post #web3 #2024goals")
@@ -111,13 +163,20 @@ class TestParseMessage:
         assert "my_tag" in result.tags
         assert "another_one" in result.tags
 
+    def test_unicode_tags(self):
+        """Test that tags in non-Latin scripts and with accents are kept whole."""
+        result = parse_message("Voyage #café #日本 #Привет")
+
+        assert result.quote == "Voyage"
+        assert result.tags == ("café", "日本", "Привет")
+
     def test_empty_string(self):
         """Test parsing an empty string."""
         result = parse_message("")
 
         assert result.quote == ""
         assert result.url is None
-        assert result.tags == []
+        assert result.tags == ()
 
     def test_only_whitespace(self):
         """Test parsing whitespace-only string."""
@@ -144,3 +203,33 @@ class TestParseMessage:
 
         assert "Some text more text" in result.quote
         assert set(result.tags) == {"start", "middle", "end"}
+
+    def test_interior_quote_preserved(self):
+        """Test that only the outer pair of quotes is removed."""
+        assert parse_message('"he said "hi""').quote == 'he said "hi"'
+
+    def test_parse_message_reuses_compiled_regex(self):
+        """Test that parsing never compiles a pattern (they're all built at import)."""
+        with patch("re.compile") as compile_:
+            result = parse_message("Compiled once https://example.com/c #regex")
+
+        assert result.tags == ("regex",)
+        compile_.assert_not_called()
+
+    def test_repeated_text_reuses_result(self):
+        """Test that an identical message is served from the cache, and can't be mutated."""
+        first = parse_message("Forwarded again #repeat")
+        second = parse_message("Forwarded again #repeat")
+
+        assert second is first
+        with pytest.raises(AttributeError):
+            first.quote = "changed"
+
+    def test_parsed_message_is_hashable(self):
+        """Test that parse results can be used as dict keys and set members."""
+        assert len({parse_message("Same #tag"), parse_message("Same  #tag")}) == 1
+
+    def test_parse_message_is_not_jit_compiled(self):
+        """Test that parse_message stays a plain function (see the module docstring on Numba)."""
+        assert not hasattr(parse_message, "__wrapped__")
+        assert type(parse_message).__module__ == "builtins"
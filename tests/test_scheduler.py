@@ -0,0 +1,128 @@
+"""Tests for the scheduler module."""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from config import get_digest_schedule
+from src import database, formatting, scheduler
+from src.formatting import MAX_MESSAGE_LENGTH, message_length
+from src.scheduler import DIGEST_HEADER, DIGEST_TRUNCATED, send_digest_to_user
+
+
+class TestSendDigest:
+    """Test cases for the weekly digest."""
+
+    @pytest.mark.asyncio
+    async def test_digest_lists_quotes_and_total(self, test_db):
+        """Test that the digest numbers each quote and ends with the total."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="Only quote")
+        bot = AsyncMock()
+
+        await send_digest_to_user(bot, 123)
+
+        text = bot.send_message.await_args.kwargs["text"]
+        assert text.startswith(DIGEST_HEADER + '1. "Only quote"')
+        assert text.endswith("\n\nTotal saved: 1 quotes")
+
+    @pytest.mark.asyncio
+    async def test_long_digest_stops_at_the_limit(self, test_db):
+        """Test that quotes past the message limit aren't formatted and the footer is kept."""
+        await database.register_user(123, "user", "User")
+        await database.save_quotes_bulk(123, [{"text": f"{i} " + "x" * 1500} for i in range(10)])
+        bot = AsyncMock()
+
+        with patch("src.scheduler.format_quote", wraps=formatting.format_quote) as format_quote:
+            await send_digest_to_user(bot, 123)
+
+        text = bot.send_message.await_args.kwargs["text"]
+        assert len(text) <= MAX_MESSAGE_LENGTH
+        assert DIGEST_TRUNCATED in text
+        assert text.endswith("Total saved: 10 quotes")
+        assert format_quote.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_oversized_first_quote_is_truncated(self, test_db):
+        """Test that a single quote longer than the limit is cut rather than dropped."""
+        await database.register_user(123, "user", "User")
+        await database.save_quote(user_id=123, text="y" * MAX_MESSAGE_LENGTH)
+        bot = AsyncMock()
+
+        await send_digest_to_user(bot, 123)
+
+        text = bot.send_message.await_args.kwargs["text"]
+        assert len(text) <= MAX_MESSAGE_LENGTH
+        assert text.startswith(DIGEST_HEADER + '1. "yyy')
+        assert text.endswith("...\n\nTotal saved: 1 quotes")
+
+
+    @pytest.mark.asyncio
+    async def test_emoji_count_as_telegram_counts_them(self, test_db):
+        """Test that emoji outside the BMP use two units of the limit each."""
+        await database.register_user(123, "user", "User")
+        await database.save_quotes_bulk(123, [{"text": "🙂" * 900} for _ in range(5)])
+        bot = AsyncMock()
+
+        await send_digest_to_user(bot, 123)
+
+        text = bot.send_message.await_args.kwargs["text"]
+        assert message_length(text) <= MAX_MESSAGE_LENGTH
+        assert DIGEST_TRUNCATED in text
+
+class TestSendToAll:
+    """Test cases for fanning scheduled messages out to every user."""
+
+    @pytest.mark.asyncio
+    async def test_digest_reaches_every_user_despite_failures(self, test_db, monkeypatch):
+        """Test that users are sent to concurrently and one failure doesn't stop the rest."""
+        monkeypatch.setattr(scheduler, "SEND_INTERVAL", 0)
+        for chat_id in (1, 2, 3):
+            await database.register_user(chat_id, f"user{chat_id}", "User")
+        in_flight = []
+        sent = []
+
+        async def fake_send(bot, chat_id):
+            in_flight.append(chat_id)
+            await asyncio.sleep(0)
+            # Every send has started before any finishes
+            assert len(in_flight) == 3
+            if chat_id == 2:
+                raise RuntimeError("blocked by user")
+            sent.append(chat_id)
+
+        with patch("src.scheduler.send_digest_to_user", fake_send):
+            await scheduler.send_digest_to_all(AsyncMock())
+
+        assert sorted(sent) == [1, 3]
+
+    @pytest.mark.asyncio
+    async def test_sends_are_rate_limited(self, monkeypatch):
+        """Test that no more than SENDS_PER_SECOND sends run within one interval."""
+        monkeypatch.setattr(scheduler, "SENDS_PER_SECOND", 2)
+        monkeypatch.setattr(scheduler, "SEND_INTERVAL", 0.05)
+        started = []
+
+        async def fake_send(bot, chat_id):
+            started.append(asyncio.get_running_loop().time())
+
+        users = [{"chat_id": chat_id} for chat_id in range(4)]
+        await scheduler._send_to_users(AsyncMock(), users, fake_send, "test")
+
+        assert started[2] - started[0] >= 0.04
+
+
+class TestTriggers:
+    """Test cases for the cached cron triggers."""
+
+    def test_digest_trigger_matches_settings_and_is_built_once(self):
+        """Test that the digest trigger follows the configured schedule and is reused."""
+        trigger = scheduler.get_digest_trigger()
+        fields = {field.name: str(field) for field in trigger.fields}
+        schedule = get_digest_schedule()
+
+        assert scheduler.get_digest_trigger() is trigger
+        assert fields["day_of_week"] == str(schedule["day_of_week"])
+        assert fields["hour"] == str(schedule["hour"])
+        assert fields["minute"] == str(schedule["minute"])